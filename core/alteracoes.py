@@ -0,0 +1,105 @@
+"""Feed incremental de alterações para sistemas que espelham o inventário.
+
+O cursor tem a forma "<xid>.<seq>". Só são entregues alterações de transações
+já encerradas (xid abaixo do xmin do snapshot atual), em ordem de (xid, seq):
+assim nenhuma transação ainda aberta pode gravar depois uma alteração "atrás"
+de um cursor já entregue. Uma transação longa apenas atrasa o feed.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+from core.db import run_query
+
+LIMITE_PADRAO = 500
+LIMITE_MAXIMO = 5000
+
+# Colunas expostas por tabela; blobs viram apenas um indicador de presença
+_COLUNAS = {
+    "maquinas": "id, linha, nome, usuario, setor, andar, ip, mac, ponto, comentario, atualizado_em",
+    "historico": "id, id_maquina, data, hora, tecnico, descricao, (foto IS NOT NULL OR foto_arquivo IS NOT NULL) AS tem_foto, atualizado_em",
+    "componentes": "id, id_maquina, nome, data_aquisicao, data_expiracao, observacao, atualizado_em",
+    "relatorios": "id, data, hora, comentario, autor, imagem IS NOT NULL AS tem_imagem, atualizado_em",
+}
+
+
+def _ler_cursor(cursor: str) -> Tuple[int, int]:
+    """Converte o cursor textual em (xid, seq). Levanta ValueError se inválido."""
+    if not cursor or cursor == "0":
+        return 0, 0
+    xid, _, seq = cursor.partition(".")
+    xid, seq = int(xid), int(seq or 0)
+    if xid < 0 or seq < 0:
+        raise ValueError("cursor inválido")
+    return xid, seq
+
+
+def listar_alteracoes(cursor: str = "0", limite: int = LIMITE_PADRAO) -> Dict[str, Any]:
+    """Retorna a próxima página de alterações após `cursor`.
+
+    Formato: {"changes": [{"table", "id", "op", "data"}], "next": cursor, "has_more": bool}.
+    Para 'upsert', 'data' traz o estado atual do registro; se ele já não existir
+    mais, a alteração é entregue como 'delete'.
+    """
+    xid, seq = _ler_cursor(cursor)
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    rows = run_query(
+        """
+        SELECT xid::text AS xid, seq, tabela, id_registro, operacao
+        FROM alteracoes
+        WHERE (xid, seq) > (%s::text::xid8, %s)
+          AND xid < pg_snapshot_xmin(pg_current_snapshot())
+        ORDER BY xid, seq
+        LIMIT %s
+        """,
+        (xid, seq, limite + 1),
+        fetch=True,
+    ) or []
+    has_more = len(rows) > limite
+    rows = rows[:limite]
+
+    # Busca o estado atual dos registros alterados: uma consulta por tabela
+    ids_por_tabela: Dict[str, List[int]] = {}
+    for r in rows:
+        if r["operacao"] == "upsert":
+            ids_por_tabela.setdefault(r["tabela"], []).append(r["id_registro"])
+    registros: Dict[Tuple[str, int], Dict] = {}
+    for tabela, ids in ids_por_tabela.items():
+        colunas = _COLUNAS.get(tabela)
+        if colunas is None:
+            continue
+        for reg in run_query(f"SELECT {colunas} FROM {tabela} WHERE id = ANY(%s)", (ids,), fetch=True) or []:
+            registros[(tabela, reg["id"])] = dict(reg)
+
+    changes = []
+    for r in rows:
+        dados = registros.get((r["tabela"], r["id_registro"])) if r["operacao"] == "upsert" else None
+        changes.append({
+            "table": r["tabela"],
+            "id": r["id_registro"],
+            "op": "upsert" if dados is not None else "delete",
+            "data": dados,
+        })
+
+    proximo = f"{rows[-1]['xid']}.{rows[-1]['seq']}" if rows else (cursor or "0")
+    return {"changes": changes, "next": proximo, "has_more": has_more}
+
+
+def versao_dados(tabelas, rede: bool = False) -> Tuple:
+    """Token barato que muda sempre que alguma das `tabelas` é alterada.
+
+    Lê o contador de cada tabela em 'alteracoes_contadores', incrementado pelo
+    trigger em ordem de commit (o maior seq de 'alteracoes' não serve: uma
+    transação mais antiga pode commitar um seq menor depois que o token já foi
+    entregue). Com `rede=True` inclui também a última varredura de rede. A data
+    do banco entra sempre: consultas com CURRENT_DATE mudam à meia-noite dele.
+    """
+    sql = (
+        "SELECT ARRAY("
+        "  SELECT COALESCE((SELECT c.n FROM alteracoes_contadores c WHERE c.tabela = t.nome), 0)"
+        "  FROM unnest(%s::text[]) WITH ORDINALITY AS t(nome, ordem) ORDER BY t.ordem"
+        ") AS contadores, CURRENT_DATE AS hoje"
+    )
+    if rede:
+        sql += ", (SELECT MAX(verificado_em) FROM maquinas_status) AS rede"
+    row = run_query(sql, (list(tabelas),), fetch=True)[0]
+    return tuple(row["contadores"]), row.get("rede"), row["hoje"]
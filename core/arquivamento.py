@@ -0,0 +1,150 @@
+"""Arquivamento frio dos anexos antigos do histórico.
+
+Move o conteúdo de 'historico.foto' de registros mais antigos que uma idade
+configurável para arquivos .zip compactados em ARQUIVO_FRIO_DIR, deixando no
+banco apenas o nome do arquivo em 'historico.foto_arquivo'. Os anexos continuam
+acessíveis por /historico/foto/{id} (ver core.historico_maquinas.obter_foto_historico).
+
+Apagar um registro (ou a máquina, em cascata) não mexe nos .zip: o anexo fica
+no arquivo até que nenhum registro o referencie mais, quando o .zip inteiro
+pode ser removido com --limpar.
+
+Uso: python -m core.arquivamento [--dias 730] [--lote 200] [--limpar]
+"""
+
+import argparse
+import hashlib
+import os
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+import psycopg2.extras
+
+from core.db import get_conn, run_query
+
+ARQUIVO_FRIO_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "arquivo_frio")
+IDADE_PADRAO_DIAS = 730
+LOTE_PADRAO = 200
+# Um .zip mais novo que isso pode ser de um lote em andamento, ainda sem o UPDATE
+CARENCIA_LIMPEZA = 3600  # segundos
+
+
+def _caminho_arquivo(nome: str) -> str:
+    # Só aceitamos nomes simples gerados por arquivar_fotos (nada de caminhos)
+    if os.path.basename(nome) != nome or not nome.endswith(".zip"):
+        raise ValueError(f"Nome de arquivo inválido: {nome!r}")
+    return os.path.join(ARQUIVO_FRIO_DIR, nome)
+
+
+def ler_foto_arquivada(nome: str, id_: int) -> Optional[bytes]:
+    """Lê o anexo do registro `id_` de dentro do arquivo frio `nome`."""
+    try:
+        with zipfile.ZipFile(_caminho_arquivo(nome)) as zf:
+            return zf.read(str(id_))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def arquivar_fotos(idade_dias: int = IDADE_PADRAO_DIAS, lote: int = LOTE_PADRAO) -> Dict[str, int]:
+    """Arquiva, em lotes, os anexos de registros com 'data' anterior a hoje - `idade_dias`.
+
+    Cada lote vira um .zip novo, gravado e sincronizado em disco antes de o banco
+    ser atualizado; uma interrupção no meio deixa no máximo um arquivo órfão,
+    nunca um anexo perdido. Rodar de novo continua de onde parou. Um anexo
+    trocado enquanto o lote era gravado não é apagado (o md5 não confere): fica
+    no banco e é arquivado, já com o conteúdo novo, na próxima execução.
+    """
+    limite = date.today() - timedelta(days=idade_dias)
+    os.makedirs(ARQUIVO_FRIO_DIR, exist_ok=True)
+    registros = 0
+    bytes_movidos = 0
+    arquivos = 0
+    ultimo = (date.min, 0)
+    while True:
+        # Paginação por (data, id) sobre historico_foto_data_idx: cada lote começa
+        # onde o anterior parou, em vez de reler e reordenar as partições antigas
+        rows = run_query(
+            """
+            SELECT id, data, foto FROM historico
+            WHERE data < %s AND foto IS NOT NULL AND (data, id) > (%s, %s)
+            ORDER BY data, id
+            LIMIT %s
+            """,
+            (limite, ultimo[0], ultimo[1], lote),
+            fetch=True,
+        ) or []
+        if not rows:
+            break
+        ultimo = (rows[-1]["data"], rows[-1]["id"])
+
+        nome = f"historico_{datetime.now():%Y%m%d%H%M%S%f}.zip"
+        caminho = _caminho_arquivo(nome)
+        with zipfile.ZipFile(caminho, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+            for r in rows:
+                zf.writestr(str(r["id"]), bytes(r["foto"]))
+        with open(caminho, "rb") as f:
+            os.fsync(f.fileno())
+
+        tamanhos = {r["id"]: len(r["foto"]) for r in rows}
+        with get_conn() as conn, conn.cursor() as cur:
+            arquivados = psycopg2.extras.execute_values(
+                cur,
+                "UPDATE historico AS h SET foto = NULL, foto_arquivo = v.arquivo "
+                "FROM (VALUES %s) AS v(id, md5, arquivo, limite) "
+                "WHERE h.id = v.id AND h.data < v.limite AND md5(h.foto) = v.md5 "
+                "RETURNING h.id",
+                [(r["id"], hashlib.md5(r["foto"]).hexdigest(), nome, limite) for r in rows],
+                template="(%s, %s, %s, %s::date)",
+                fetch=True,
+            )
+            conn.commit()
+        if not arquivados:
+            # Todos os anexos do lote mudaram no meio do caminho: o .zip não é referenciado
+            os.remove(caminho)
+            continue
+        registros += len(arquivados)
+        bytes_movidos += sum(tamanhos[id_] for id_, in arquivados)
+        arquivos += 1
+    return {"registros": registros, "bytes": bytes_movidos, "arquivos": arquivos}
+
+
+def limpar_arquivos_orfaos(carencia: int = CARENCIA_LIMPEZA) -> int:
+    """Remove os .zip que nenhum registro do histórico referencia mais; retorna quantos."""
+    if not os.path.isdir(ARQUIVO_FRIO_DIR):
+        return 0
+    rows = run_query("SELECT DISTINCT foto_arquivo FROM historico WHERE foto_arquivo IS NOT NULL", fetch=True) or []
+    referenciados = {r["foto_arquivo"] for r in rows}
+    corte = time.time() - carencia
+    removidos = 0
+    for nome in os.listdir(ARQUIVO_FRIO_DIR):
+        if not nome.endswith(".zip") or nome in referenciados:
+            continue
+        caminho = _caminho_arquivo(nome)
+        if os.path.getmtime(caminho) < corte:
+            os.remove(caminho)
+            removidos += 1
+    return removidos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move anexos antigos do histórico para o armazenamento frio.")
+    parser.add_argument("--dias", type=int, default=IDADE_PADRAO_DIAS, help="idade mínima do registro, em dias")
+    parser.add_argument("--lote", type=int, default=LOTE_PADRAO, help="registros por arquivo .zip")
+    parser.add_argument("--limpar", action="store_true", help="remove também os .zip sem nenhum registro referenciando")
+    args = parser.parse_args(argv)
+
+    resultado = arquivar_fotos(args.dias, args.lote)
+    print(
+        f"{resultado['registros']} anexo(s) arquivado(s) em {resultado['arquivos']} arquivo(s), "
+        f"{resultado['bytes'] / (1024 * 1024):.1f} MB removidos do banco."
+    )
+    if args.limpar:
+        print(f"{limpar_arquivos_orfaos()} arquivo(s) .zip sem referência removido(s).")
+    if resultado["registros"]:
+        print("Execute VACUUM historico para devolver o espaço ao sistema.")
+
+
+if __name__ == "__main__":
+    main()
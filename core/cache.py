@@ -0,0 +1,143 @@
+"""Cache em memória por processo, invalidado entre workers via LISTEN/NOTIFY.
+
+Cada valor em cache declara de quais tabelas depende. O trigger
+registrar_alteracao (core/db.py) faz `pg_notify('inventario_cache', <tabela>)`
+a cada escrita; cada worker mantém uma thread escutando esse canal e descarta
+as entradas das tabelas notificadas. As funções de escrita do próprio processo
+também invalidam localmente, para que o redirect após um POST já veja o dado novo.
+
+A notificação chega a cada worker com algum atraso. Páginas servidas com ETag
+(webapp/main.py) passam `versao=` (o token de core.alteracoes.versao_dados usado
+no ETag), que entra na chave: um corpo em cache nunca sai sob um ETag de outra
+versão dos dados.
+
+Se a conexão de escuta cair, o cache é esvaziado e as novas entradas passam a
+usar um TTL curto até a escuta ser restabelecida.
+"""
+
+import functools
+import select
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+import psycopg2.extensions
+
+from core.db import get_conn
+
+CANAL = "inventario_cache"
+TTL_CONECTADO = 300       # segundos; a escuta garante a invalidação
+TTL_DESCONECTADO = 5      # segundos; sem escuta, aceitamos no máximo isso de atraso
+INTERVALO_KEEPALIVE = 10  # segundos sem notificações antes de testar a conexão
+
+_lock = threading.Lock()
+_entradas: Dict[Tuple, Tuple[float, Any, Tuple[str, ...]]] = {}
+_geracoes: Dict[str, int] = {}
+_geracao_global = 0
+_conectado = threading.Event()
+_parar = threading.Event()
+_thread = None
+
+
+def invalidar(*tabelas: str) -> None:
+    """Descarta as entradas que dependem de qualquer uma das `tabelas`."""
+    with _lock:
+        for t in tabelas:
+            _geracoes[t] = _geracoes.get(t, 0) + 1
+        alvo = set(tabelas)
+        for chave in [k for k, (_, _, deps) in _entradas.items() if alvo.intersection(deps)]:
+            del _entradas[chave]
+
+
+def invalidar_tudo() -> None:
+    global _geracao_global
+    with _lock:
+        _geracao_global += 1
+        _entradas.clear()
+
+
+def _geracao_atual(tabelas: Tuple[str, ...]) -> Tuple:
+    return (_geracao_global,) + tuple(_geracoes.get(t, 0) for t in tabelas)
+
+
+def em_cache(*tabelas: str) -> Callable:
+    """Decorador: guarda o resultado da função por argumentos, dependente de `tabelas`.
+
+    O argumento nomeado opcional `versao` não é repassado à função; só separa as
+    entradas por versão dos dados.
+    """
+    def decorador(func):
+        @functools.wraps(func)
+        def wrapper(*args, versao=None, **kwargs):
+            chave = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())), versao)
+            with _lock:
+                item = _entradas.get(chave)
+                if item is not None and item[0] > time.monotonic():
+                    return item[1]
+                geracao = _geracao_atual(tabelas)
+
+            valor = func(*args, **kwargs)
+
+            ttl = TTL_CONECTADO if _conectado.is_set() else TTL_DESCONECTADO
+            with _lock:
+                # Não guarda se houve invalidação enquanto a consulta rodava
+                if geracao == _geracao_atual(tabelas):
+                    _entradas[chave] = (time.monotonic() + ttl, valor, tabelas)
+            return valor
+        return wrapper
+    return decorador
+
+
+def _processar_notificacoes(conn) -> None:
+    while conn.notifies:
+        n = conn.notifies.pop(0)
+        invalidar(n.payload)
+
+
+def _escutar() -> None:
+    espera = 1
+    while not _parar.is_set():
+        conn = None
+        try:
+            conn = get_conn()
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CANAL}")
+            # Notificações podem ter sido perdidas enquanto estávamos desconectados
+            invalidar_tudo()
+            _conectado.set()
+            espera = 1
+            while not _parar.is_set():
+                if select.select([conn], [], [], INTERVALO_KEEPALIVE) == ([], [], []):
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                else:
+                    conn.poll()
+                _processar_notificacoes(conn)
+        except Exception as e:
+            print(f"Escuta de invalidação de cache interrompida: {e}")
+        finally:
+            if _conectado.is_set():
+                _conectado.clear()
+                invalidar_tudo()
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        _parar.wait(espera)
+        espera = min(espera * 2, 60)
+
+
+def iniciar_escuta() -> None:
+    """Inicia a thread de escuta deste processo (chamado no startup do app)."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _parar.clear()
+    _thread = threading.Thread(target=_escutar, name="cache-listen", daemon=True)
+    _thread.start()
+
+
+def parar_escuta() -> None:
+    _parar.set()
@@ -1,9 +1,11 @@
 from typing import Optional, List, Dict, Any
 from core.db import run_query
+from core.cache import em_cache, invalidar
 
 def listar_componentes(fetch: bool = True):
     return run_query("SELECT * FROM componentes ORDER BY id", fetch=fetch)
 
+@em_cache("componentes")
 def listar_componentes_por_maquina(id_maquina: int, fetch: bool = True):
     return run_query("SELECT * FROM componentes WHERE id_maquina = %s ORDER BY nome", params=(id_maquina,), fetch=fetch)
 
@@ -16,6 +18,7 @@ def adicionar_componente(id_maquina: int, nome: str, data_aquisicao: Optional[st
         "INSERT INTO componentes (id_maquina, nome, data_aquisicao, data_expiracao, observacao) VALUES (%s, %s, %s, %s, %s)",
         params=(id_maquina, nome, data_aquisicao, data_expiracao, observacao)
     )
+    invalidar("componentes")
 
 def atualizar_componente(id_: int, nome: str, data_aquisicao: Optional[str]=None, data_expiracao: Optional[str]=None, observacao: Optional[str]=None):
     run_query(
@@ -26,11 +29,14 @@ def atualizar_componente(id_: int, nome: str, data_aquisicao: Optional[str]=None
         """,
         params=(nome, data_aquisicao, data_expiracao, observacao, id_)
     )
+    invalidar("componentes")
 
 def remover_componente(id_: int):
     run_query("DELETE FROM componentes WHERE id = %s", params=(id_,))
+    invalidar("componentes")
 
 
+@em_cache("componentes", "maquinas")
 def listar_componentes_expirando(dias: int = 10) -> List[Dict[str, Any]]:
     """Retorna componentes cuja data de expiração ocorrerá nos próximos `dias`.
 
@@ -0,0 +1,91 @@
+"""Consultas do painel gerencial.
+
+Todas leem apenas as tabelas de resumo mantidas por triggers (ver _SQL_RESUMOS em
+core/db.py), cujo tamanho depende do número de máquinas e de meses, nunca do
+tamanho do histórico.
+"""
+
+from datetime import date
+from typing import Any, Dict, List
+
+from core.db import run_query, SQL_RECONSTRUIR_RESUMOS
+
+
+def _inicio_do_mes(d: date, deslocamento: int = 0) -> date:
+    total = d.year * 12 + (d.month - 1) + deslocamento
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def resumo_por_setor() -> List[Dict[str, Any]]:
+    """Quantidade de máquinas por setor/andar."""
+    return run_query(
+        "SELECT setor, andar, total FROM resumo_setor_andar ORDER BY setor, andar",
+        fetch=True,
+    ) or []
+
+
+def manutencoes_por_mes(meses: int = 12) -> Dict[str, Any]:
+    """Eventos de manutenção por máquina nos últimos `meses` meses (incluindo o atual).
+
+    Retorna {"meses": [date, ...], "maquinas": [{"id", "nome", "totais": [int, ...]}, ...]}.
+    """
+    hoje = date.today()
+    lista_meses = [_inicio_do_mes(hoje, -i) for i in range(meses - 1, -1, -1)]
+    rows = run_query(
+        """
+        SELECT r.id_maquina, m.nome, m.linha, r.mes, r.total
+        FROM resumo_manutencao_mensal r
+        JOIN maquinas m ON m.id = r.id_maquina
+        WHERE r.mes >= %s
+        ORDER BY m.linha, r.id_maquina
+        """,
+        (lista_meses[0],),
+        fetch=True,
+    ) or []
+    posicao = {mes: i for i, mes in enumerate(lista_meses)}
+    por_maquina: Dict[int, Dict[str, Any]] = {}
+    for r in rows:
+        item = por_maquina.setdefault(r["id_maquina"], {"id": r["id_maquina"], "nome": r["nome"], "totais": [0] * meses})
+        i = posicao.get(r["mes"])
+        if i is not None:
+            item["totais"][i] = r["total"]
+    return {"meses": lista_meses, "maquinas": list(por_maquina.values())}
+
+
+def componentes_expirando_por_mes(meses: int = 12) -> List[Dict[str, Any]]:
+    """Componentes que expiram em cada um dos próximos `meses` meses (a partir do atual)."""
+    hoje = date.today()
+    inicio, fim = _inicio_do_mes(hoje), _inicio_do_mes(hoje, meses)
+    rows = run_query(
+        "SELECT mes, total FROM resumo_expiracao_mensal WHERE mes >= %s AND mes < %s",
+        (inicio, fim),
+        fetch=True,
+    ) or []
+    totais = {r["mes"]: r["total"] for r in rows}
+    return [{"mes": _inicio_do_mes(hoje, i), "total": totais.get(_inicio_do_mes(hoje, i), 0)} for i in range(meses)]
+
+
+def maquinas_sem_manutencao(meses: int = 12) -> List[Dict[str, Any]]:
+    """Máquinas sem nenhum registro no histórico nos últimos `meses` meses."""
+    return run_query(
+        """
+        SELECT m.id, m.linha, m.nome, m.setor, m.andar, u.ultima
+        FROM maquinas m
+        LEFT JOIN resumo_ultima_manutencao u ON u.id_maquina = m.id
+        WHERE u.ultima IS NULL OR u.ultima < CURRENT_DATE - make_interval(months => %s)
+        ORDER BY u.ultima NULLS FIRST, m.linha
+        """,
+        (meses,),
+        fetch=True,
+    ) or []
+
+
+def reconstruir_resumos() -> None:
+    """Recalcula todos os resumos a partir das tabelas de origem."""
+    run_query(SQL_RECONSTRUIR_RESUMOS)
+
+
+if __name__ == "__main__":
+    # Correção manual: python -m core.dashboard
+    reconstruir_resumos()
+    print("Resumos do painel reconstruídos.")
@@ -1,4 +1,7 @@
+import datetime
+
 import psycopg2
+import psycopg2.errors
 import psycopg2.extras
 
 DB_CONFIG = {
@@ -15,9 +18,281 @@ def get_conn():
     return conn
 
 
+def _garantir_particoes_historico(cur, anos):
+    for ano in sorted({int(a) for a in anos}):
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS historico_{ano} PARTITION OF historico "
+            f"FOR VALUES FROM ('{ano}-01-01') TO ('{ano + 1}-01-01')"
+        )
+
+
+_anos_com_particao = set()
+
+
+def garantir_particao_historico(data) -> None:
+    """Cria (se preciso) a partição anual de 'historico' que receberá `data`.
+
+    Chamado antes de gravar no histórico: sem isso, uma data de um ano ainda sem
+    partição cairia em historico_padrao e impediria criar a partição depois.
+    """
+    if not data:
+        return
+    ano = data.year if hasattr(data, "year") else int(str(data)[:4])
+    if ano in _anos_com_particao:
+        return
+    try:
+        with get_conn() as conn, conn.cursor() as cur:
+            _garantir_particoes_historico(cur, [ano])
+            conn.commit()
+    except (psycopg2.errors.DuplicateTable, psycopg2.errors.UniqueViolation):
+        # Outro worker criou a mesma partição ao mesmo tempo
+        pass
+    _anos_com_particao.add(ano)
+
+
+# Tabelas de resumo do painel (core/dashboard.py). São mantidas incrementalmente
+# por triggers, de modo que qualquer escrita (core.*, reconciliação, cascatas)
+# atualiza só as linhas de resumo afetadas, sem recalcular sobre o histórico todo.
+_SQL_RESUMOS = """
+    CREATE TABLE IF NOT EXISTS resumo_setor_andar (
+        setor TEXT NOT NULL,
+        andar TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        PRIMARY KEY (setor, andar)
+    );
+    CREATE TABLE IF NOT EXISTS resumo_manutencao_mensal (
+        id_maquina INTEGER NOT NULL,
+        mes DATE NOT NULL,
+        total INTEGER NOT NULL,
+        PRIMARY KEY (id_maquina, mes)
+    );
+    CREATE INDEX IF NOT EXISTS resumo_manutencao_mensal_mes_idx ON resumo_manutencao_mensal (mes);
+    CREATE TABLE IF NOT EXISTS resumo_ultima_manutencao (
+        id_maquina INTEGER PRIMARY KEY,
+        ultima DATE NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS resumo_expiracao_mensal (
+        mes DATE PRIMARY KEY,
+        total INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS historico_maquina_data_idx ON historico (id_maquina, data);
+
+    CREATE OR REPLACE FUNCTION resumo_maquinas_trg() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.setor IS NOT DISTINCT FROM NEW.setor
+                            AND OLD.andar IS NOT DISTINCT FROM NEW.andar THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE resumo_setor_andar SET total = total - 1
+            WHERE setor = COALESCE(OLD.setor, '') AND andar = COALESCE(OLD.andar, '');
+            DELETE FROM resumo_setor_andar
+            WHERE setor = COALESCE(OLD.setor, '') AND andar = COALESCE(OLD.andar, '') AND total <= 0;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO resumo_setor_andar (setor, andar, total)
+            VALUES (COALESCE(NEW.setor, ''), COALESCE(NEW.andar, ''), 1)
+            ON CONFLICT (setor, andar) DO UPDATE SET total = resumo_setor_andar.total + 1;
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION resumo_recalcular_ultima(p_id_maquina INTEGER) RETURNS void AS $$
+        DELETE FROM resumo_ultima_manutencao WHERE id_maquina = p_id_maquina;
+        INSERT INTO resumo_ultima_manutencao (id_maquina, ultima)
+        SELECT p_id_maquina, MAX(data) FROM historico
+        WHERE id_maquina = p_id_maquina
+        HAVING MAX(data) IS NOT NULL;
+    $$ LANGUAGE sql;
+
+    CREATE OR REPLACE FUNCTION resumo_historico_trg() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.id_maquina = NEW.id_maquina
+                            AND OLD.data IS NOT DISTINCT FROM NEW.data THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.data IS NOT NULL THEN
+            UPDATE resumo_manutencao_mensal SET total = total - 1
+            WHERE id_maquina = OLD.id_maquina AND mes = date_trunc('month', OLD.data)::date;
+            DELETE FROM resumo_manutencao_mensal
+            WHERE id_maquina = OLD.id_maquina AND mes = date_trunc('month', OLD.data)::date AND total <= 0;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.data IS NOT NULL THEN
+            INSERT INTO resumo_manutencao_mensal (id_maquina, mes, total)
+            VALUES (NEW.id_maquina, date_trunc('month', NEW.data)::date, 1)
+            ON CONFLICT (id_maquina, mes) DO UPDATE SET total = resumo_manutencao_mensal.total + 1;
+        END IF;
+        -- Inserção só pode avançar a última data; alteração/remoção recalcula pelo índice (id_maquina, data)
+        IF TG_OP = 'INSERT' THEN
+            IF NEW.data IS NOT NULL THEN
+                INSERT INTO resumo_ultima_manutencao (id_maquina, ultima) VALUES (NEW.id_maquina, NEW.data)
+                ON CONFLICT (id_maquina) DO UPDATE
+                SET ultima = GREATEST(resumo_ultima_manutencao.ultima, EXCLUDED.ultima);
+            END IF;
+        ELSE
+            PERFORM resumo_recalcular_ultima(OLD.id_maquina);
+            IF TG_OP = 'UPDATE' AND NEW.id_maquina <> OLD.id_maquina THEN
+                PERFORM resumo_recalcular_ultima(NEW.id_maquina);
+            END IF;
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION resumo_componentes_trg() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.data_expiracao IS NOT DISTINCT FROM NEW.data_expiracao THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.data_expiracao IS NOT NULL THEN
+            UPDATE resumo_expiracao_mensal SET total = total - 1
+            WHERE mes = date_trunc('month', OLD.data_expiracao)::date;
+            DELETE FROM resumo_expiracao_mensal
+            WHERE mes = date_trunc('month', OLD.data_expiracao)::date AND total <= 0;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.data_expiracao IS NOT NULL THEN
+            INSERT INTO resumo_expiracao_mensal (mes, total)
+            VALUES (date_trunc('month', NEW.data_expiracao)::date, 1)
+            ON CONFLICT (mes) DO UPDATE SET total = resumo_expiracao_mensal.total + 1;
+        END IF;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS resumo_maquinas ON maquinas;
+    CREATE TRIGGER resumo_maquinas AFTER INSERT OR DELETE OR UPDATE OF setor, andar ON maquinas
+        FOR EACH ROW EXECUTE FUNCTION resumo_maquinas_trg();
+    DROP TRIGGER IF EXISTS resumo_historico ON historico;
+    CREATE TRIGGER resumo_historico AFTER INSERT OR DELETE OR UPDATE OF id_maquina, data ON historico
+        FOR EACH ROW EXECUTE FUNCTION resumo_historico_trg();
+    DROP TRIGGER IF EXISTS resumo_componentes ON componentes;
+    CREATE TRIGGER resumo_componentes AFTER INSERT OR DELETE OR UPDATE OF data_expiracao ON componentes
+        FOR EACH ROW EXECUTE FUNCTION resumo_componentes_trg();
+"""
+
+# Recalcula todos os resumos do zero (primeira instalação ou correção manual).
+# O LOCK impede escritas concorrentes de se perderem durante a reconstrução.
+SQL_RECONSTRUIR_RESUMOS = """
+    LOCK TABLE maquinas, historico, componentes IN SHARE MODE;
+    TRUNCATE resumo_setor_andar, resumo_manutencao_mensal, resumo_ultima_manutencao, resumo_expiracao_mensal;
+    INSERT INTO resumo_setor_andar (setor, andar, total)
+    SELECT COALESCE(setor, ''), COALESCE(andar, ''), COUNT(*) FROM maquinas
+    GROUP BY 1, 2;
+    INSERT INTO resumo_manutencao_mensal (id_maquina, mes, total)
+    SELECT id_maquina, date_trunc('month', data)::date, COUNT(*) FROM historico
+    WHERE data IS NOT NULL GROUP BY 1, 2;
+    INSERT INTO resumo_ultima_manutencao (id_maquina, ultima)
+    SELECT id_maquina, MAX(data) FROM historico
+    WHERE data IS NOT NULL GROUP BY 1;
+    INSERT INTO resumo_expiracao_mensal (mes, total)
+    SELECT date_trunc('month', data_expiracao)::date, COUNT(*) FROM componentes
+    WHERE data_expiracao IS NOT NULL GROUP BY 1;
+"""
+
+
+# Feed de alterações para clientes de sincronização (core/alteracoes.py).
+# Cada tabela sincronizada ganha 'atualizado_em' e triggers que registram em
+# 'alteracoes' a última operação de cada registro (inclusive remoções, como
+# tombstones). Só a entrada mais recente por registro é mantida, então a tabela
+# cresce com o número de registros, não com o número de escritas.
+TABELAS_SINCRONIZADAS = ("maquinas", "historico", "componentes", "relatorios")
+
+_SQL_ALTERACOES = """
+    CREATE TABLE IF NOT EXISTS alteracoes (
+        seq BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        xid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+        tabela TEXT NOT NULL,
+        id_registro INTEGER NOT NULL,
+        operacao TEXT NOT NULL,
+        alterado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE INDEX IF NOT EXISTS alteracoes_cursor_idx ON alteracoes (xid, seq);
+    CREATE INDEX IF NOT EXISTS alteracoes_registro_idx ON alteracoes (tabela, id_registro);
+    DROP INDEX IF EXISTS alteracoes_tabela_seq_idx;
+
+    -- Versão por tabela para os ETags (core.alteracoes.versao_dados). O seq da
+    -- identity segue a ordem de início das transações, não a de commit; já o
+    -- incremento (contar_alteracao, uma vez por comando) segura o lock da linha
+    -- até o commit, então o valor visível só cresce e muda a cada commit que
+    -- altera a tabela.
+    CREATE TABLE IF NOT EXISTS alteracoes_contadores (
+        tabela TEXT PRIMARY KEY,
+        n BIGINT NOT NULL DEFAULT 0
+    );
+
+    CREATE OR REPLACE FUNCTION marcar_atualizado_em() RETURNS trigger AS $$
+    BEGIN
+        NEW.atualizado_em := now();
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql;
+
+    -- TG_ARGV[0] é o nome lógico da tabela (TG_TABLE_NAME seria o da partição)
+    CREATE OR REPLACE FUNCTION registrar_alteracao() RETURNS trigger AS $$
+    DECLARE
+        v_id INTEGER;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            v_id := OLD.id;
+        ELSE
+            v_id := NEW.id;
+        END IF;
+        DELETE FROM alteracoes WHERE tabela = TG_ARGV[0] AND id_registro = v_id;
+        INSERT INTO alteracoes (tabela, id_registro, operacao)
+        VALUES (TG_ARGV[0], v_id, CASE WHEN TG_OP = 'DELETE' THEN 'delete' ELSE 'upsert' END);
+        -- Invalida os caches dos workers (core/cache.py); payloads iguais na mesma transação são agrupados
+        PERFORM pg_notify('inventario_cache', TG_ARGV[0]);
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+
+    -- FOR EACH STATEMENT: um lote de 10 mil linhas gera um incremento, não 10 mil
+    -- versões da mesma linha do contador
+    CREATE OR REPLACE FUNCTION contar_alteracao() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO alteracoes_contadores (tabela, n) VALUES (TG_ARGV[0], 1)
+        ON CONFLICT (tabela) DO UPDATE SET n = alteracoes_contadores.n + 1;
+        RETURN NULL;
+    END $$ LANGUAGE plpgsql;
+"""
+
+_SQL_ALTERACOES_TABELA = """
+    ALTER TABLE {tabela} ADD COLUMN IF NOT EXISTS atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now();
+    DROP TRIGGER IF EXISTS {tabela}_atualizado_em ON {tabela};
+    CREATE TRIGGER {tabela}_atualizado_em BEFORE UPDATE ON {tabela}
+        FOR EACH ROW EXECUTE FUNCTION marcar_atualizado_em();
+    DROP TRIGGER IF EXISTS {tabela}_alteracoes ON {tabela};
+    CREATE TRIGGER {tabela}_alteracoes AFTER INSERT OR UPDATE OR DELETE ON {tabela}
+        FOR EACH ROW EXECUTE FUNCTION registrar_alteracao('{tabela}');
+    DROP TRIGGER IF EXISTS {tabela}_versao ON {tabela};
+    CREATE TRIGGER {tabela}_versao AFTER INSERT OR UPDATE OR DELETE ON {tabela}
+        FOR EACH STATEMENT EXECUTE FUNCTION contar_alteracao('{tabela}');
+"""
+
+
+# Incrementar sempre que init_db() ganhar DDL novo: os workers comparam este número
+# com o gravado em 'schema_versao' e só rodam init_db() se estiverem atrás.
+SCHEMA_VERSAO = 6
+_LOCK_SCHEMA = 7305001  # chave de pg_advisory_xact_lock que serializa init_db()
+
+
+def schema_atualizado() -> bool:
+    """Verificação rápida (uma consulta) de que o banco já está na SCHEMA_VERSAO."""
+    try:
+        rows = run_query("SELECT versao FROM schema_versao", fetch=True)
+    except psycopg2.errors.UndefinedTable:
+        return False
+    return bool(rows) and rows[0]["versao"] >= SCHEMA_VERSAO
+
+
+def preparar_schema() -> None:
+    """Usado no startup dos workers: roda init_db() apenas se o schema estiver desatualizado."""
+    if not schema_atualizado():
+        init_db()
+
+
 def init_db():
+    """Cria/migra todo o schema. Em produção, rode uma vez por deploy: python -m core.db"""
     try:
         with get_conn() as conn, conn.cursor() as cur:
+            # Vários workers subindo juntos com o schema desatualizado: só um migra por vez
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_SCHEMA,))
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS maquinas (
                     id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
@@ -32,28 +307,55 @@ def init_db():
                     comentario TEXT
                 );
             """)
-            # Criar a tabela 'historico' com o esquema esperado pelo restante do código
+            # 'historico' é particionada por ano de 'data' (historico_<ano>); registros sem data
+            # ficam em historico_padrao. Consultas com intervalo de datas leem só as partições
+            # envolvidas. Uma tabela 'historico' antiga (não particionada) é migrada abaixo.
+            cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('public.historico')")
+            row = cur.fetchone()
+            historico_legado = row is not None and row[0] == "r"
+            if historico_legado:
+                cur.execute("ALTER TABLE historico RENAME TO historico_legado")
             cur.execute("""
+                CREATE SEQUENCE IF NOT EXISTS historico_seq;
                 CREATE TABLE IF NOT EXISTS historico (
-                    id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                    id INTEGER NOT NULL DEFAULT nextval('historico_seq'),
                     id_maquina INTEGER NOT NULL REFERENCES maquinas(id) ON DELETE CASCADE,
                     data DATE,
                     hora TIME,
                     tecnico TEXT,
                     descricao TEXT,
                     foto BYTEA
-                );
+                ) PARTITION BY RANGE (data);
+                ALTER SEQUENCE historico_seq OWNED BY historico.id;
+                CREATE TABLE IF NOT EXISTS historico_padrao PARTITION OF historico DEFAULT;
+                CREATE INDEX IF NOT EXISTS historico_id_idx ON historico (id);
             """)
             # Garantir coluna 'foto' (para ambientes já existentes sem recriar a tabela)
             try:
                 cur.execute("ALTER TABLE historico ADD COLUMN IF NOT EXISTS foto BYTEA;")
             except Exception:
                 pass
+            # Nome do arquivo .zip em core/arquivamento.py quando a foto foi movida para o armazenamento frio
+            cur.execute("ALTER TABLE historico ADD COLUMN IF NOT EXISTS foto_arquivo TEXT;")
+            # Paginação do arquivamento por (data, id): só cobre anexos ainda no banco
+            cur.execute("CREATE INDEX IF NOT EXISTS historico_foto_data_idx ON historico (data, id) WHERE foto IS NOT NULL;")
+            ano_atual = datetime.date.today().year
+            _garantir_particoes_historico(cur, [ano_atual, ano_atual + 1])
+            if historico_legado:
+                cur.execute("SELECT DISTINCT EXTRACT(YEAR FROM data)::int FROM historico_legado WHERE data IS NOT NULL")
+                _garantir_particoes_historico(cur, [r[0] for r in cur.fetchall()])
+                cur.execute("""
+                    INSERT INTO historico (id, id_maquina, data, hora, tecnico, descricao, foto)
+                    SELECT id, id_maquina, data, hora, tecnico, descricao, foto FROM historico_legado
+                """)
+                cur.execute("DROP TABLE historico_legado")
             # Se existir a tabela antiga 'historico_maquinas', migrar os dados para a nova tabela 'historico'
             # Faz a migração apenas dos registros que ainda não existam em 'historico' (evita duplicatas)
             cur.execute("SELECT to_regclass('public.historico_maquinas')")
             old_table = cur.fetchone()[0]
             if old_table is not None:
+                cur.execute("SELECT DISTINCT EXTRACT(YEAR FROM created_at)::int FROM historico_maquinas WHERE created_at IS NOT NULL")
+                _garantir_particoes_historico(cur, [r[0] for r in cur.fetchall()])
                 # Inserir registros faltantes na nova tabela, mapeando colunas:
                 # maquina_id -> id_maquina, created_at -> data/hora, responsavel -> tecnico, evento -> descricao
                 cur.execute("""
@@ -66,6 +368,66 @@ def init_db():
                     LEFT JOIN historico h ON h.id = hm.id
                     WHERE h.id IS NULL
                 """)
+            # Ids copiados explicitamente nas migrações não avançam a sequência
+            cur.execute("SELECT setval('historico_seq', GREATEST((SELECT MAX(id) FROM historico), 1))")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS componentes (
+                    id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                    id_maquina INTEGER NOT NULL REFERENCES maquinas(id) ON DELETE CASCADE,
+                    nome TEXT,
+                    data_aquisicao DATE,
+                    data_expiracao DATE,
+                    observacao TEXT
+                );
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS relatorios (
+                    id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                    data DATE,
+                    hora TIME,
+                    comentario TEXT,
+                    imagem BYTEA,
+                    autor TEXT
+                );
+            """)
+            # Último resultado da varredura de rede por máquina (ver core/rede.py)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS maquinas_status (
+                    id_maquina INTEGER PRIMARY KEY REFERENCES maquinas(id) ON DELETE CASCADE,
+                    online BOOLEAN NOT NULL,
+                    latencia_ms REAL,
+                    verificado_em TIMESTAMP NOT NULL,
+                    visto_em TIMESTAMP
+                );
+                CREATE INDEX IF NOT EXISTS maquinas_status_verificado_idx ON maquinas_status (verificado_em);
+            """)
+            # Resumos do painel: cria tabelas/triggers e, na primeira vez, popula a partir dos dados atuais
+            cur.execute("SELECT to_regclass('public.resumo_setor_andar')")
+            resumos_novos = cur.fetchone()[0] is None
+            cur.execute(_SQL_RESUMOS)
+            if resumos_novos:
+                cur.execute(SQL_RECONSTRUIR_RESUMOS)
+            cur.execute(_SQL_ALTERACOES)
+            for tabela in TABELAS_SINCRONIZADAS:
+                cur.execute(_SQL_ALTERACOES_TABELA.format(tabela=tabela))
+            # Ponto de retomada de tarefas de manutenção em lote (ex.: core/recompressao.py)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS tarefas_progresso (
+                    tarefa TEXT PRIMARY KEY,
+                    ultimo_id INTEGER NOT NULL
+                );
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_versao (
+                    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                    versao INTEGER NOT NULL
+                );
+            """)
+            cur.execute(
+                "INSERT INTO schema_versao (id, versao) VALUES (TRUE, %s) "
+                "ON CONFLICT (id) DO UPDATE SET versao = EXCLUDED.versao",
+                (SCHEMA_VERSAO,),
+            )
             conn.commit()
     except Exception as e:
         print(f"Erro ao inicializar DB: {e}")
@@ -78,3 +440,21 @@ def run_query(query, params=None, fetch=False):
             return cur.fetchall()
         conn.commit()
 
+
+def run_values(query, rows, template=None, page_size=1000):
+    """Executa `query` (com um único `VALUES %s`) para várias linhas de uma vez.
+
+    Usa psycopg2.extras.execute_values, que agrupa as linhas em poucos comandos
+    em vez de um round trip por linha.
+    """
+    if not rows:
+        return
+    with get_conn() as conn, conn.cursor() as cur:
+        psycopg2.extras.execute_values(cur, query, rows, template=template, page_size=page_size)
+        conn.commit()
+
+
+if __name__ == "__main__":
+    # Preparação do schema, uma vez por deploy: python -m core.db
+    init_db()
+    print(f"Schema na versão {SCHEMA_VERSAO}.")
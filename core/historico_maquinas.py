@@ -2,30 +2,60 @@
 
 As funções usam a tabela 'historico' (id, id_maquina, data, hora, tecnico, descricao)
 e retornam/recebem dados compatíveis com as rotas em webapp/main.py.
+
+A tabela é particionada por ano de 'data': sempre que houver um intervalo de
+datas (ou a data do registro), ele é passado na consulta para que o Postgres
+leia só as partições necessárias.
 """
 
 from typing import Optional, List, Dict
-from core.db import run_query
+from core.db import run_query, garantir_particao_historico
+from core.arquivamento import ler_foto_arquivada
+
+# O anexo em si não é lido nas listagens; basta saber se existe (no banco ou arquivado)
+_TEM_FOTO = "(h.foto IS NOT NULL OR h.foto_arquivo IS NOT NULL) AS tem_foto"
+
 
+def filtro_periodo(data_inicio=None, data_fim=None, coluna: str = "h.data"):
+    """Condições SQL e parâmetros para restringir `coluna` ao intervalo [data_inicio, data_fim]."""
+    condicoes, params = [], []
+    if data_inicio:
+        condicoes.append(f"{coluna} >= %s"); params.append(data_inicio)
+    if data_fim:
+        condicoes.append(f"{coluna} <= %s"); params.append(data_fim)
+    return condicoes, params
 
-def listar_historico(maquina_id: Optional[int] = None) -> List[Dict]:
+
+def listar_historico(maquina_id: Optional[int] = None, data_inicio=None, data_fim=None) -> List[Dict]:
     """Retorna uma lista de registros do histórico. Se maquina_id for fornecido,
-    filtra apenas os registros dessa máquina."""
+    filtra apenas os registros dessa máquina; data_inicio/data_fim limitam o período."""
     base_query = (
-        "SELECT h.id, h.id_maquina, h.data, h.hora, h.tecnico, h.descricao, h.foto, m.nome AS maquina "
+        f"SELECT h.id, h.id_maquina, h.data, h.hora, h.tecnico, h.descricao, {_TEM_FOTO}, m.nome AS maquina "
         "FROM historico h LEFT JOIN maquinas m ON m.id = h.id_maquina"
     )
-    params = None
+    condicoes, params = filtro_periodo(data_inicio, data_fim)
     if maquina_id is not None:
-        base_query += " WHERE h.id_maquina = %s"
-        params = (maquina_id,)
+        condicoes.append("h.id_maquina = %s"); params.append(maquina_id)
+    if condicoes:
+        base_query += " WHERE " + " AND ".join(condicoes)
 
     base_query += " ORDER BY h.data DESC, h.hora DESC"
-    return run_query(base_query, params, fetch=True)
+    return run_query(base_query, params or None, fetch=True)
+
+
+def obter_historico(id_: int) -> Optional[Dict]:
+    """Retorna um registro do histórico (sem o anexo) ou None."""
+    rows = run_query(
+        f"SELECT h.id, h.id_maquina, h.data, h.hora, h.tecnico, h.descricao, {_TEM_FOTO} FROM historico h WHERE h.id = %s",
+        (id_,),
+        fetch=True,
+    )
+    return rows[0] if rows else None
 
 
 def adicionar_historico(id_maquina: int, data: str, hora: str, tecnico: str, descricao: str, foto_bytes: bytes | None) -> None:
     """Insere um novo item no histórico."""
+    garantir_particao_historico(data)
     run_query(
         "INSERT INTO historico (id_maquina, data, hora, tecnico, descricao, foto) VALUES (%s,%s,%s,%s,%s,%s)",
         (id_maquina, data, hora, tecnico, descricao, foto_bytes),
@@ -40,6 +70,7 @@ def remover_historico(id_: int) -> None:
 def atualizar_historico(id_: int, data=None, hora=None, tecnico=None, descricao=None, foto: bytes | None = None):
     sets, params = [], []
     if data is not None:
+        garantir_particao_historico(data)
         sets.append("data=%s"); params.append(data)
     if hora is not None:
         sets.append("hora=%s"); params.append(hora)
@@ -50,17 +81,45 @@ def atualizar_historico(id_: int, data=None, hora=None, tecnico=None, descricao=
     if foto is not None:
         if isinstance(foto, memoryview):
             foto = bytes(foto)
-        sets.append("foto=%s"); params.append(foto)
+        sets.append("foto=%s, foto_arquivo=NULL"); params.append(foto)
     if not sets:
         return
     params.append(id_)
     run_query(f"UPDATE historico SET {', '.join(sets)} WHERE id=%s", params)
 
-def obter_foto_historico(id_: int) -> bytes | None:
-    rows = run_query("SELECT foto FROM historico WHERE id=%s", (id_,), fetch=True)
+def obter_foto_historico(id_: int, data=None) -> bytes | None:
+    """Retorna o anexo do registro, lendo do armazenamento frio se já foi arquivado.
+
+    `data` (a data do registro) é opcional; quando informada, evita procurar o id
+    em todas as partições.
+    """
+    query = "SELECT foto, foto_arquivo FROM historico WHERE id=%s"
+    params = [id_]
+    if data:
+        query += " AND data=%s"; params.append(data)
+    rows = run_query(query, params, fetch=True)
     if not rows:
         return None
     raw = rows[0].get("foto")
     if raw is None:
+        if rows[0].get("foto_arquivo"):
+            return ler_foto_arquivada(rows[0]["foto_arquivo"], id_)
         return None
     return bytes(raw)
+
+
+def obter_fotos_historico(ids: List[int]) -> Dict[int, bytes]:
+    """Anexos de vários registros de uma vez ({id: bytes}); registros sem anexo ficam de fora."""
+    if not ids:
+        return {}
+    rows = run_query(
+        "SELECT id, foto, foto_arquivo FROM historico WHERE id = ANY(%s) AND (foto IS NOT NULL OR foto_arquivo IS NOT NULL)",
+        (list(ids),),
+        fetch=True,
+    ) or []
+    fotos = {}
+    for r in rows:
+        dados = bytes(r["foto"]) if r["foto"] is not None else ler_foto_arquivada(r["foto_arquivo"], r["id"])
+        if dados:
+            fotos[r["id"]] = dados
+    return fotos
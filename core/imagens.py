@@ -0,0 +1,106 @@
+"""Detecção de tipo e recompressão dos anexos (fotos do histórico, imagens de relatórios).
+
+A mesma política é usada no upload (webapp/main.py) e na manutenção em lote
+(core/recompressao.py): imagens grandes são reduzidas a MAX_LADO pixels no maior
+lado e regravadas no mesmo formato (BMP vira PNG), e o resultado só é usado se
+for menor que o original. PDFs, GIFs e imagens animadas (WebP, APNG) são
+mantidos como estão.
+"""
+
+import io
+
+MAX_LADO = 2048            # pixels no maior lado
+QUALIDADE = 82             # JPEG/WebP
+TAMANHO_MINIMO = 256 * 1024  # abaixo disso nem vale decodificar
+
+
+def detectar_tipo_midia(data: bytes) -> str:
+    if data.startswith(b"%PDF"):
+        return "application/pdf"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"GIF87a") or data.startswith(b"GIF89a"):
+        return "image/gif"
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith(b"BM"):
+        return "image/bmp"
+    return "application/octet-stream"
+
+
+# tipo de origem -> formato de saída do Pillow
+_FORMATOS_SAIDA = {
+    "image/jpeg": "JPEG",
+    "image/png": "PNG",
+    "image/webp": "WEBP",
+    "image/bmp": "PNG",
+}
+
+
+def recomprimir(dados: bytes | None, max_lado: int = MAX_LADO, qualidade: int = QUALIDADE) -> bytes | None:
+    """Retorna uma versão menor da imagem, ou os próprios `dados` se não houver ganho.
+
+    Sem o Pillow instalado, ou para formatos não suportados, devolve `dados` intacto.
+    """
+    if not dados or len(dados) < TAMANHO_MINIMO:
+        return dados
+    formato = _FORMATOS_SAIDA.get(detectar_tipo_midia(dados))
+    if formato is None:
+        return dados
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return dados
+
+    try:
+        with Image.open(io.BytesIO(dados)) as original:
+            # Salvar só o primeiro quadro perderia a animação
+            if getattr(original, "is_animated", False):
+                return dados
+            # Sem o perfil ICC, fotos em Display P3 (celulares) ficariam com cores lavadas
+            icc = original.info.get("icc_profile")
+            # Fotos de celular vêm "deitadas" com a rotação só no EXIF
+            img = ImageOps.exif_transpose(original)
+            img.thumbnail((max_lado, max_lado))
+            saida = io.BytesIO()
+            if formato == "JPEG":
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                img.save(saida, "JPEG", quality=qualidade, optimize=True, progressive=True, icc_profile=icc)
+            elif formato == "WEBP":
+                img.save(saida, "WEBP", quality=qualidade, method=6, icc_profile=icc)
+            else:
+                img.save(saida, "PNG", optimize=True, icc_profile=icc)
+    except Exception:
+        # Arquivo corrompido ou truncado: melhor guardar como veio
+        return dados
+
+    novo = saida.getvalue()
+    return novo if len(novo) < len(dados) else dados
+
+
+def miniatura(dados: bytes | None, lado: int = 400) -> bytes | None:
+    """JPEG reduzido para embutir em PDFs, ou None se `dados` não for uma imagem legível."""
+    if not dados:
+        return None
+    tipo = detectar_tipo_midia(dados)
+    if not tipo.startswith("image/"):
+        return None
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        # O ReportLab embute JPEG sem o Pillow; os demais formatos ficam de fora
+        return dados if tipo == "image/jpeg" else None
+    try:
+        with Image.open(io.BytesIO(dados)) as original:
+            img = ImageOps.exif_transpose(original)
+            img.thumbnail((lado, lado))
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            saida = io.BytesIO()
+            img.save(saida, "JPEG", quality=75)
+    except Exception:
+        return None
+    return saida.getvalue()
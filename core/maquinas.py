@@ -1,6 +1,8 @@
 from dataclasses import dataclass
+from datetime import datetime
 from typing import List, Optional
 from core.db import run_query
+from core.cache import em_cache, invalidar
 
 @dataclass
 class Maquina:
@@ -14,8 +16,10 @@ class Maquina:
     mac: Optional[str]
     ponto: Optional[str]
     comentario: Optional[str]
+    atualizado_em: Optional[datetime] = None
 
 
+@em_cache("maquinas")
 def listar_maquinas() -> List[Maquina]:
     rows = run_query("SELECT * FROM maquinas ORDER BY linha", fetch=True)
     if not rows:
@@ -36,6 +40,7 @@ def adicionar_maquina(nome, mac, usuario, linha: Optional[int] = None, setor=Non
         "INSERT INTO maquinas (linha, nome, usuario, setor, andar, ip, mac, ponto, comentario) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
         (linha, nome, usuario, setor, andar, ip, mac, ponto, comentario)
     )
+    invalidar("maquinas")
 
 
 def remover_maquina(id_):
@@ -44,6 +49,7 @@ def remover_maquina(id_):
     # ON DELETE CASCADE (isso é seguro mesmo se a constraint já for cascade).
     run_query("DELETE FROM historico WHERE id_maquina = %s", (id_,))
     run_query("DELETE FROM maquinas WHERE id = %s", (id_,))
+    invalidar("maquinas", "componentes", "historico")
 
 
 def atualizar_maquina(id_, nome, mac, usuario, linha, setor=None, andar=None, ip=None, ponto=None, comentario=None):
@@ -54,4 +60,36 @@ def atualizar_maquina(id_, nome, mac, usuario, linha, setor=None, andar=None, ip
         WHERE id = %s
         """,
         (linha, nome, usuario, setor, andar, ip, mac, ponto, comentario, id_),
-    )
\ No newline at end of file
+    )
+    invalidar("maquinas")
+
+
+def obter_dossie(id_, limite_historico: int = 20):
+    """Retorna a máquina com status de rede, componentes e os últimos registros do
+    histórico em uma única consulta (agregação JSON), ou None se não existir."""
+    rows = run_query(
+        """
+        SELECT m.id, m.linha, m.nome, m.usuario, m.setor, m.andar, m.ip, m.mac, m.ponto, m.comentario,
+               s.online, s.latencia_ms, s.verificado_em, s.visto_em,
+               COALESCE((
+                   SELECT json_agg(c ORDER BY c.nome)
+                   FROM (SELECT id, nome, data_aquisicao, data_expiracao, observacao
+                         FROM componentes WHERE id_maquina = m.id) c
+               ), '[]') AS componentes,
+               COALESCE((
+                   SELECT json_agg(h ORDER BY h.data DESC, h.hora DESC)
+                   FROM (SELECT id, data, hora, tecnico, descricao,
+                                (foto IS NOT NULL OR foto_arquivo IS NOT NULL) AS tem_foto
+                         FROM historico WHERE id_maquina = m.id
+                         ORDER BY data DESC, hora DESC
+                         LIMIT %s) h
+               ), '[]') AS historico,
+               (SELECT COUNT(*) FROM historico WHERE id_maquina = m.id) AS total_historico
+        FROM maquinas m
+        LEFT JOIN maquinas_status s ON s.id_maquina = m.id
+        WHERE m.id = %s
+        """,
+        (limite_historico, id_),
+        fetch=True,
+    )
+    return rows[0] if rows else None
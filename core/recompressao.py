@@ -0,0 +1,127 @@
+"""Recompressão em lote dos anexos já gravados (historico.foto e relatorios.imagem).
+
+Percorre cada tabela em ordem de id, em lotes, recomprimindo em um pool de
+processos com a política de core/imagens.py, e grava de volta só o que ficou
+menor. O último id processado fica em 'tarefas_progresso', então a tarefa pode
+ser interrompida e retomada a qualquer momento.
+
+Uso: python -m core.recompressao [--lote 50] [--processos N] [--max-lado 2048] [--qualidade 82] [--reiniciar]
+"""
+
+import argparse
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+
+import psycopg2.extras
+
+from core.db import get_conn, run_query
+from core.imagens import recomprimir, MAX_LADO, QUALIDADE, TAMANHO_MINIMO
+
+# tabela -> coluna do blob
+TABELAS = {"historico": "foto", "relatorios": "imagem"}
+LOTE_PADRAO = 50
+
+
+def _tarefa(tabela: str) -> str:
+    return f"recompressao:{tabela}"
+
+
+def _ler_progresso(tarefa: str) -> int:
+    rows = run_query("SELECT ultimo_id FROM tarefas_progresso WHERE tarefa = %s", (tarefa,), fetch=True)
+    return rows[0]["ultimo_id"] if rows else 0
+
+
+def _gravar_progresso(tarefa: str, ultimo_id: int) -> None:
+    run_query(
+        "INSERT INTO tarefas_progresso (tarefa, ultimo_id) VALUES (%s, %s) "
+        "ON CONFLICT (tarefa) DO UPDATE SET ultimo_id = EXCLUDED.ultimo_id",
+        (tarefa, ultimo_id),
+    )
+
+
+def _recomprimir_item(item):
+    """Executado nos processos do pool: retorna (id, md5_original, novo) ou None sem ganho."""
+    id_, dados, max_lado, qualidade = item
+    novo = recomprimir(dados, max_lado=max_lado, qualidade=qualidade)
+    if novo is None or len(novo) >= len(dados):
+        return None
+    return id_, hashlib.md5(dados).hexdigest(), novo
+
+
+def recomprimir_tabela(tabela: str, executor, lote: int = LOTE_PADRAO,
+                       max_lado: int = MAX_LADO, qualidade: int = QUALIDADE) -> Dict[str, int]:
+    coluna = TABELAS[tabela]
+    tarefa = _tarefa(tabela)
+    ultimo_id = _ler_progresso(tarefa)
+    resultado = {"analisados": 0, "recomprimidos": 0, "bytes_antes": 0, "bytes_depois": 0}
+    while True:
+        rows = run_query(
+            f"""
+            SELECT id, {coluna} AS dados FROM {tabela}
+            WHERE id > %s AND {coluna} IS NOT NULL AND octet_length({coluna}) >= %s
+            ORDER BY id
+            LIMIT %s
+            """,
+            (ultimo_id, TAMANHO_MINIMO, lote),
+            fetch=True,
+        ) or []
+        if not rows:
+            break
+
+        itens = [(r["id"], bytes(r["dados"]), max_lado, qualidade) for r in rows]
+        tamanhos = {id_: len(dados) for id_, dados, _, _ in itens}
+        melhorias = [m for m in executor.map(_recomprimir_item, itens) if m is not None]
+        # O md5 garante que um anexo trocado pelo usuário enquanto o lote era
+        # processado não seja sobrescrito pela versão antiga recomprimida
+        gravados = set()
+        if melhorias:
+            with get_conn() as conn, conn.cursor() as cur:
+                gravados = {id_ for id_, in psycopg2.extras.execute_values(
+                    cur,
+                    f"UPDATE {tabela} AS t SET {coluna} = v.dados "
+                    f"FROM (VALUES %s) AS v(id, md5, dados) "
+                    f"WHERE t.id = v.id AND md5(t.{coluna}) = v.md5 "
+                    f"RETURNING t.id",
+                    melhorias,
+                    fetch=True,
+                )}
+                conn.commit()
+        melhorias = [m for m in melhorias if m[0] in gravados]
+
+        resultado["analisados"] += len(rows)
+        resultado["recomprimidos"] += len(melhorias)
+        resultado["bytes_antes"] += sum(tamanhos[id_] for id_, _, _ in melhorias)
+        resultado["bytes_depois"] += sum(len(novo) for _, _, novo in melhorias)
+        ultimo_id = rows[-1]["id"]
+        _gravar_progresso(tarefa, ultimo_id)
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recomprime fotos do histórico e imagens de relatórios já gravadas.")
+    parser.add_argument("--lote", type=int, default=LOTE_PADRAO, help="anexos lidos por vez")
+    parser.add_argument("--processos", type=int, default=os.cpu_count(), help="processos de recompressão")
+    parser.add_argument("--max-lado", type=int, default=MAX_LADO, help="pixels no maior lado")
+    parser.add_argument("--qualidade", type=int, default=QUALIDADE, help="qualidade JPEG/WebP (1-95)")
+    parser.add_argument("--reiniciar", action="store_true", help="ignora o progresso salvo e começa do início")
+    args = parser.parse_args(argv)
+
+    if args.reiniciar:
+        for tabela in TABELAS:
+            _gravar_progresso(_tarefa(tabela), 0)
+
+    with ProcessPoolExecutor(max_workers=args.processos) as executor:
+        for tabela in TABELAS:
+            r = recomprimir_tabela(tabela, executor, lote=args.lote, max_lado=args.max_lado, qualidade=args.qualidade)
+            liberado = (r["bytes_antes"] - r["bytes_depois"]) / (1024 * 1024)
+            print(
+                f"{tabela}: {r['analisados']} analisado(s), {r['recomprimidos']} recomprimido(s), "
+                f"{liberado:.1f} MB liberados."
+            )
+    print("Execute VACUUM nas tabelas para devolver o espaço ao sistema.")
+
+
+if __name__ == "__main__":
+    main()
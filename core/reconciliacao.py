@@ -0,0 +1,170 @@
+"""Reconciliação de IPs das máquinas a partir de leases DHCP ou tabelas ARP.
+
+Lê os arquivos linha a linha (sem carregá-los inteiros na memória), monta um
+índice MAC -> IP normalizado, compara com 'maquinas' em uma única passada e
+aplica as mudanças em lote, registrando cada uma no 'historico'.
+
+Formatos reconhecidos:
+  - ISC dhcpd.leases (blocos "lease <ip> { ... hardware ethernet <mac>; ... }";
+    só leases com "binding state active" contam)
+  - dnsmasq.leases ("<expira> <mac> <ip> <host> <client-id>")
+  - arp -a (Linux/Windows) e "ip neigh" (qualquer linha com um IPv4 e um MAC)
+
+Uso: python -m core.reconciliacao arquivo [arquivo ...] [--dry-run]
+"""
+
+import argparse
+import re
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import psycopg2.extras
+
+from core.db import get_conn, garantir_particao_historico
+
+_RE_IPV4 = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b")
+_RE_MAC = re.compile(
+    r"\b(?:[0-9a-fA-F]{2}[:-]){5}[0-9a-fA-F]{2}\b"   # aa:bb:cc:dd:ee:ff / aa-bb-cc-dd-ee-ff
+    r"|\b(?:[0-9a-fA-F]{4}\.){2}[0-9a-fA-F]{4}\b"    # aabb.ccdd.eeff (Cisco)
+)
+_RE_LEASE = re.compile(r"^\s*lease\s+((?:\d{1,3}\.){3}\d{1,3})\s*\{")
+_RE_HARDWARE = re.compile(r"^\s*hardware\s+ethernet\s+([0-9a-fA-F:.-]+)\s*;")
+# Ancorado no início da linha: não casa "next binding state" nem "rewind binding state"
+_RE_BINDING = re.compile(r"^\s*binding\s+state\s+(\w+)\s*;")
+
+# MACs que aparecem em ARP mas nunca identificam uma máquina
+_MACS_IGNORADOS = {"000000000000", "ffffffffffff"}
+
+TECNICO_PADRAO = "Reconciliação automática"
+
+
+def normalizar_mac(mac: Optional[str]) -> Optional[str]:
+    """Converte qualquer grafia de MAC para 'aa:bb:cc:dd:ee:ff' (ou None se inválido)."""
+    if not mac:
+        return None
+    hexa = re.sub(r"[^0-9a-fA-F]", "", mac).lower()
+    if len(hexa) != 12 or hexa in _MACS_IGNORADOS:
+        return None
+    return ":".join(hexa[i:i + 2] for i in range(0, 12, 2))
+
+
+def _pares_do_arquivo(linhas: Iterable[str]) -> Iterable[Tuple[str, str]]:
+    """Gera pares (mac_normalizado, ip) na ordem em que aparecem no arquivo."""
+    lease_ip = None
+    lease_mac = None
+    lease_estado = None
+    for linha in linhas:
+        if lease_ip is not None:
+            # Dentro de um bloco do dhcpd.leases
+            m = _RE_HARDWARE.match(linha)
+            if m:
+                lease_mac = normalizar_mac(m.group(1))
+                continue
+            m = _RE_BINDING.match(linha)
+            if m:
+                lease_estado = m.group(1).lower()
+            elif linha.strip().startswith("}"):
+                # free, expired, released, abandoned, backup... não indicam posse atual do IP
+                if lease_mac and lease_estado == "active":
+                    yield lease_mac, lease_ip
+                lease_ip = lease_mac = lease_estado = None
+            continue
+
+        m = _RE_LEASE.match(linha)
+        if m:
+            lease_ip = m.group(1)
+            continue
+
+        m_ip = _RE_IPV4.search(linha)
+        m_mac = _RE_MAC.search(linha)
+        if m_ip and m_mac:
+            mac = normalizar_mac(m_mac.group(0))
+            if mac:
+                yield mac, m_ip.group(0)
+
+
+def construir_indice(caminhos: Iterable[str]) -> Dict[str, str]:
+    """Monta o índice MAC -> IP a partir dos arquivos; a última ocorrência vence
+    (no dhcpd.leases, o lease mais recente é sempre o último gravado)."""
+    indice: Dict[str, str] = {}
+    for caminho in caminhos:
+        with open(caminho, encoding="utf-8", errors="replace") as f:
+            for mac, ip in _pares_do_arquivo(f):
+                indice[mac] = ip
+    return indice
+
+
+def calcular_mudancas(indice: Dict[str, str], maquinas: Iterable[Dict]) -> List[Tuple[int, Optional[str], str]]:
+    """Compara o índice com as máquinas em uma passada; retorna (id, ip_antigo, ip_novo)."""
+    mudancas = []
+    for m in maquinas:
+        mac = normalizar_mac(m["mac"])
+        if mac is None:
+            continue
+        ip_novo = indice.get(mac)
+        ip_antigo = (m["ip"] or "").strip() or None
+        if ip_novo and ip_novo != ip_antigo:
+            mudancas.append((m["id"], ip_antigo, ip_novo))
+    return mudancas
+
+
+def reconciliar(caminhos: Iterable[str], tecnico: str = TECNICO_PADRAO, aplicar: bool = True) -> List[Tuple[int, Optional[str], str]]:
+    """Reconcilia 'maquinas.ip' com os arquivos informados.
+
+    Atualizações e entradas de histórico são gravadas na mesma transação,
+    cada uma com um único comando em lote.
+    """
+    caminhos = list(caminhos)
+    indice = construir_indice(caminhos)
+    origem = ", ".join(caminhos)
+    agora = datetime.now()
+    if aplicar:
+        # Cria a partição do ano (se preciso) em conexão própria, antes de abrir
+        # a transação que segura os locks de 'maquinas' até o commit
+        garantir_particao_historico(agora.date())
+
+    with get_conn() as conn, conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute("SELECT id, mac, ip FROM maquinas")
+        mudancas = calcular_mudancas(indice, cur.fetchall())
+        if not mudancas or not aplicar:
+            return mudancas
+
+        psycopg2.extras.execute_values(
+            cur,
+            "UPDATE maquinas AS m SET ip = v.ip FROM (VALUES %s) AS v(id, ip) WHERE m.id = v.id",
+            [(id_maquina, ip_novo) for id_maquina, _, ip_novo in mudancas],
+        )
+        psycopg2.extras.execute_values(
+            cur,
+            "INSERT INTO historico (id_maquina, data, hora, tecnico, descricao) VALUES %s",
+            [
+                (
+                    id_maquina,
+                    agora.date(),
+                    agora.time().replace(microsecond=0),
+                    tecnico,
+                    f"IP atualizado de {ip_antigo or '(vazio)'} para {ip_novo} (origem: {origem})",
+                )
+                for id_maquina, ip_antigo, ip_novo in mudancas
+            ],
+        )
+        conn.commit()
+    return mudancas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcilia maquinas.ip com leases DHCP ou tabelas ARP.")
+    parser.add_argument("arquivos", nargs="+", help="arquivos de lease DHCP ou dumps de ARP")
+    parser.add_argument("--tecnico", default=TECNICO_PADRAO, help="nome gravado no histórico")
+    parser.add_argument("--dry-run", action="store_true", help="apenas lista as mudanças, sem gravar")
+    args = parser.parse_args(argv)
+
+    mudancas = reconciliar(args.arquivos, tecnico=args.tecnico, aplicar=not args.dry_run)
+    for id_maquina, ip_antigo, ip_novo in mudancas:
+        print(f"máquina {id_maquina}: {ip_antigo or '(vazio)'} -> {ip_novo}")
+    acao = "encontradas" if args.dry_run else "aplicadas"
+    print(f"{len(mudancas)} mudança(s) {acao}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Varredura de alcançabilidade de rede das máquinas do inventário.
+
+Sonda o IP de cada máquina com conexões TCP concorrentes (asyncio), grava o
+resultado na tabela 'maquinas_status' e expõe esse cache para as páginas, que
+nunca esperam pela rede.
+
+Usamos TCP connect em vez de ICMP porque ICMP exige socket raw (root/CAP_NET_RAW).
+Uma conexão recusada (RST) também conta como "online": o host respondeu, só a
+porta está fechada.
+"""
+
+import asyncio
+import errno
+import ipaddress
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from core.db import get_conn, run_query, run_values
+
+# Portas comuns em estações Windows/Linux da rede interna
+PORTAS_SONDA = (445, 135, 3389, 22, 80)
+TIMEOUT_SONDA = 1.0          # segundos por tentativa de conexão
+CONCORRENCIA = 256           # hosts sondados ao mesmo tempo
+LIMITE_CONEXOES = 768        # sockets abertos ao mesmo tempo (abaixo do ulimit -n usual de 1024)
+INTERVALO_VARREDURA = 120    # segundos entre varreduras em segundo plano
+
+_LOCK_VARREDURA = 7305002    # chave de pg_try_advisory_lock: uma varredura por vez entre os workers
+
+# Falta de descritores é problema local, não do host sondado
+_ERROS_LOCAIS = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS)
+
+
+class RecursosEsgotados(RuntimeError):
+    """O processo ficou sem sockets durante a sondagem; o resultado do host é desconhecido."""
+
+
+async def _tentar_porta(ip: str, porta: int, timeout: float,
+                        conexoes: Optional[asyncio.Semaphore] = None) -> Optional[float]:
+    """Retorna a latência em ms se o host respondeu na porta, senão None."""
+    if conexoes is None:
+        return await _conectar(ip, porta, timeout)
+    async with conexoes:
+        return await _conectar(ip, porta, timeout)
+
+
+async def _conectar(ip: str, porta: int, timeout: float) -> Optional[float]:
+    inicio = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, porta), timeout)
+    except ConnectionRefusedError:
+        # RST: o host está no ar, apenas a porta está fechada
+        return (time.perf_counter() - inicio) * 1000
+    except asyncio.TimeoutError:
+        return None
+    except OSError as e:
+        if e.errno in _ERROS_LOCAIS:
+            raise RecursosEsgotados(str(e)) from e
+        return None
+    latencia = (time.perf_counter() - inicio) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
+    return latencia
+
+
+async def sondar_host(ip: str, portas=PORTAS_SONDA, timeout: float = TIMEOUT_SONDA,
+                      conexoes: Optional[asyncio.Semaphore] = None) -> Optional[float]:
+    """Tenta todas as portas em paralelo e retorna a primeira resposta (ms) ou None.
+
+    Em paralelo, um host offline custa um único `timeout`, não um por porta.
+    `conexoes` limita os sockets abertos ao mesmo tempo por toda a varredura.
+    Levanta RecursosEsgotados se o processo ficar sem descritores.
+    """
+    tarefas = [asyncio.create_task(_tentar_porta(ip, p, timeout, conexoes)) for p in portas]
+    try:
+        for fut in asyncio.as_completed(tarefas):
+            latencia = await fut
+            if latencia is not None:
+                return latencia
+        return None
+    finally:
+        for t in tarefas:
+            t.cancel()
+
+
+def _ip_valido(ip: Optional[str]) -> Optional[str]:
+    if not ip:
+        return None
+    try:
+        return str(ipaddress.ip_address(ip.strip()))
+    except ValueError:
+        return None
+
+
+def _listar_alvos() -> List[Tuple[int, str]]:
+    rows = run_query("SELECT id, ip FROM maquinas WHERE ip IS NOT NULL AND ip <> ''", fetch=True) or []
+    alvos = []
+    for r in rows:
+        ip = _ip_valido(r["ip"])
+        if ip:
+            alvos.append((r["id"], ip))
+    return alvos
+
+
+def _reservar_varredura(intervalo: float):
+    """Tenta ser o worker que varre nesta rodada.
+
+    Retorna a conexão que segura o advisory lock de sessão (a ser passada para
+    _liberar_varredura) ou None se outro worker está varrendo ou já varreu há
+    menos de `intervalo` segundos. Assim, com N workers, a rede continua sendo
+    varrida uma vez por intervalo, não N.
+    """
+    conn = get_conn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (_LOCK_VARREDURA,))
+            if cur.fetchone()[0]:
+                cur.execute(
+                    "SELECT COALESCE(MAX(verificado_em) > LOCALTIMESTAMP - make_interval(secs => %s), FALSE) "
+                    "FROM maquinas_status",
+                    (intervalo * 0.8,),
+                )
+                recente = cur.fetchone()[0]
+                conn.commit()
+                if not recente:
+                    return conn
+                cur.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_VARREDURA,))
+                conn.commit()
+    except Exception:
+        conn.close()
+        raise
+    conn.close()
+    return None
+
+
+def _liberar_varredura(conn) -> None:
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_VARREDURA,))
+        conn.commit()
+    finally:
+        # Fechar a sessão também solta o lock, mesmo se o unlock falhar
+        conn.close()
+
+
+def _agora_banco() -> datetime:
+    return run_query("SELECT LOCALTIMESTAMP AS agora", fetch=True)[0]["agora"]
+
+
+def _gravar_status(resultados: List[Tuple[int, Optional[float]]], verificado_em: datetime) -> None:
+    linhas = [
+        (id_maquina, latencia is not None, latencia, verificado_em, verificado_em if latencia is not None else None)
+        for id_maquina, latencia in resultados
+    ]
+    # Um único upsert em lote; 'visto_em' só avança quando o host respondeu
+    run_values(
+        """
+        INSERT INTO maquinas_status (id_maquina, online, latencia_ms, verificado_em, visto_em)
+        VALUES %s
+        ON CONFLICT (id_maquina) DO UPDATE
+        SET online = EXCLUDED.online,
+            latencia_ms = EXCLUDED.latencia_ms,
+            verificado_em = EXCLUDED.verificado_em,
+            visto_em = COALESCE(EXCLUDED.visto_em, maquinas_status.visto_em)
+        """,
+        linhas,
+    )
+
+
+async def varrer_rede(concorrencia: int = CONCORRENCIA, timeout: float = TIMEOUT_SONDA) -> Dict[str, int]:
+    """Sonda todas as máquinas com IP válido e grava o resultado.
+
+    Com concorrência limitada por semáforo, o tempo total fica próximo de
+    (sockets / LIMITE_CONEXOES) * timeout: ~13s para 2000 máquinas offline com os
+    padrões. O total de sockets abertos nunca passa de LIMITE_CONEXOES; hosts
+    cuja sondagem esbarrou no limite de descritores não têm o status alterado.
+    """
+    alvos = await asyncio.to_thread(_listar_alvos)
+    semaforo = asyncio.Semaphore(concorrencia)
+    conexoes = asyncio.Semaphore(LIMITE_CONEXOES)
+    sem_resultado = 0
+
+    async def _sondar(id_maquina: int, ip: str):
+        nonlocal sem_resultado
+        async with semaforo:
+            try:
+                return id_maquina, await sondar_host(ip, timeout=timeout, conexoes=conexoes)
+            except RecursosEsgotados:
+                sem_resultado += 1
+                return None
+
+    # Relógio do banco, o mesmo que _reservar_varredura usa para decidir se a última
+    # varredura venceu; o do app pode estar em outro fuso
+    verificado_em = await asyncio.to_thread(_agora_banco)
+    resultados = [r for r in await asyncio.gather(*(_sondar(id_maquina, ip) for id_maquina, ip in alvos)) if r]
+    await asyncio.to_thread(_gravar_status, resultados, verificado_em)
+    online = sum(1 for _, latencia in resultados if latencia is not None)
+    return {"total": len(alvos), "online": online, "offline": len(resultados) - online,
+            "sem_resultado": sem_resultado}
+
+
+async def agendar_varredura(intervalo: float = INTERVALO_VARREDURA) -> None:
+    """Laço em segundo plano: varre a rede a cada `intervalo` segundos até ser cancelado.
+
+    Todos os workers rodam este laço, mas só quem obtém o advisory lock e encontra
+    a última varredura vencida efetivamente sonda a rede.
+    """
+    while True:
+        try:
+            conn = await asyncio.to_thread(_reservar_varredura, intervalo)
+            if conn is not None:
+                try:
+                    await varrer_rede()
+                finally:
+                    await asyncio.to_thread(_liberar_varredura, conn)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Erro na varredura de rede: {e}")
+        await asyncio.sleep(intervalo)
+
+
+def listar_status_maquinas() -> Dict[int, Dict]:
+    """Retorna o último status conhecido de cada máquina, indexado por id_maquina."""
+    rows = run_query(
+        "SELECT id_maquina, online, latencia_ms, verificado_em, visto_em FROM maquinas_status",
+        fetch=True,
+    ) or []
+    return {r["id_maquina"]: r for r in rows}
+
+
+if __name__ == "__main__":
+    # Execução avulsa: python -m core.rede
+    print(asyncio.run(varrer_rede()))
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from datetime import datetime
 from typing import List, Optional
 from core.db import run_query
 
@@ -10,6 +11,7 @@ class Relatorio:
     comentario: Optional[str]
     imagem: Optional[bytes]
     autor: Optional[str]
+    atualizado_em: Optional[datetime] = None
 
 def listar_relatorios() -> List[Relatorio]:
     rows = run_query("SELECT * FROM relatorios ORDER BY data DESC, hora DESC", fetch=True)
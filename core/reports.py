@@ -1,8 +1,19 @@
 from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.utils import ImageReader
 from core.db import run_query
+from core.historico_maquinas import filtro_periodo, obter_fotos_historico
+from core.imagens import miniatura
+from core.maquinas import obter_dossie
 from tempfile import NamedTemporaryFile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from xml.sax.saxutils import escape
+import multiprocessing
+import os
+import re
+import zipfile
 from reportlab.lib.units import mm
 from reportlab.lib import colors
 
@@ -62,12 +73,19 @@ def gerar_pdf_maquinas():
     col_widths = [18*mm, 55*mm, 35*mm, 35*mm, 18*mm, 30*mm, 40*mm, 20*mm, 65*mm]
     return _make_table(data, col_widths=col_widths, title="Relatório de Máquinas")
 
-def gerar_pdf_historico():
+def gerar_pdf_historico(maquina_id=None, data_inicio=None, data_fim=None):
     # join historico with maquinas to include machine name
+    # o intervalo de datas limita a leitura às partições anuais envolvidas
+    condicoes, params = filtro_periodo(data_inicio, data_fim)
+    if maquina_id is not None:
+        condicoes.append("h.id_maquina = %s"); params.append(maquina_id)
+    where = (" WHERE " + " AND ".join(condicoes)) if condicoes else ""
     rows = run_query(
         "SELECT h.data, h.hora, m.nome AS maquina, h.tecnico, h.descricao "
-        "FROM historico h LEFT JOIN maquinas m ON h.id_maquina = m.id "
-        "ORDER BY h.data DESC, h.hora DESC",
+        "FROM historico h LEFT JOIN maquinas m ON h.id_maquina = m.id"
+        + where +
+        " ORDER BY h.data DESC, h.hora DESC",
+        params or None,
         fetch=True,
     )
     data = [["Data", "Hora", "Máquina", "Técnico", "Descrição"]]
@@ -106,4 +124,112 @@ def gerar_pdf_relatorios():
         [r["autor"], r["data"], r["hora"], r["comentario"]] for r in rows
     ]
     col_widths = [25*mm, 25*mm, 25*mm, 180*mm]
-    return _make_table(data, col_widths=col_widths, title="Relatório de Registros")
\ No newline at end of file
+    return _make_table(data, col_widths=col_widths, title="Relatório de Registros")
+
+
+_TABLE_STYLE = [
+    ("GRID", (0,0), (-1,-1), 0.4, colors.grey),
+    ("VALIGN", (0,0), (-1,-1), "TOP"),
+    ("LEFTPADDING", (0,0), (-1,-1), 3),
+    ("RIGHTPADDING", (0,0), (-1,-1), 3),
+    ("TOPPADDING", (0,0), (-1,-1), 3),
+    ("BOTTOMPADDING", (0,0), (-1,-1), 3),
+]
+
+def _thumbnail(dados, max_w, max_h):
+    thumb = miniatura(dados)
+    if thumb is None:
+        return ""
+    try:
+        w, h = ImageReader(BytesIO(thumb)).getSize()
+    except Exception:
+        return ""
+    factor = min(max_w / w, max_h / h, 1)
+    return Image(BytesIO(thumb), width=w * factor, height=h * factor)
+
+def gerar_pdf_maquina(id_, limite_historico=50):
+    """Dossiê de uma máquina: dados, componentes e últimos registros do histórico com miniaturas das fotos."""
+    dossie = obter_dossie(id_, limite_historico)
+    if dossie is None:
+        return None
+    fotos = obter_fotos_historico([h["id"] for h in dossie["historico"] if h.get("tem_foto")])
+
+    tmp = NamedTemporaryFile(delete=False, suffix=".pdf")
+    doc = SimpleDocTemplate(tmp.name, pagesize=A4,
+                            leftMargin=15*mm, rightMargin=15*mm, topMargin=15*mm, bottomMargin=15*mm)
+    styles = getSampleStyleSheet()
+    body_style = ParagraphStyle("body", parent=styles["BodyText"], fontSize=8, leading=10, spaceAfter=0)
+
+    def p(value, bold=False):
+        text = escape(str(value)) if value is not None else ""
+        return Paragraph(f"<b>{text}</b>" if bold else text, body_style)
+
+    elements = [Paragraph(escape(f"Dossiê da Máquina - {dossie['nome'] or ''}"), styles["Heading2"]), Spacer(1, 6)]
+
+    if dossie["online"] is None:
+        rede = "Sem dados"
+    elif dossie["online"]:
+        rede = f"Online ({dossie['latencia_ms']:.0f} ms)" if dossie["latencia_ms"] is not None else "Online"
+    else:
+        rede = f"Offline (visto em {dossie['visto_em']:%d/%m/%Y %H:%M})" if dossie["visto_em"] else "Offline"
+    campos = [("Linha", dossie["linha"]), ("Usuário", dossie["usuario"]), ("Setor", dossie["setor"]),
+              ("Andar", dossie["andar"]), ("IP", dossie["ip"]), ("MAC", dossie["mac"]),
+              ("Ponto", dossie["ponto"]), ("Rede", rede), ("Comentário", dossie["comentario"])]
+    info = Table([[p(k, bold=True), p(v)] for k, v in campos], colWidths=[35*mm, doc.width - 35*mm])
+    info.setStyle(_TABLE_STYLE + [("BACKGROUND", (0,0), (0,-1), colors.whitesmoke)])
+    elements += [info, Spacer(1, 10)]
+
+    elements.append(Paragraph("Componentes", styles["Heading3"]))
+    comps = [[p(c, bold=True) for c in ("Nome", "Aquisição", "Expiração", "Observação")]] + [
+        [p(c["nome"]), p(c["data_aquisicao"]), p(c["data_expiracao"]), p(c["observacao"])] for c in dossie["componentes"]
+    ]
+    if len(comps) > 1:
+        table = Table(comps, colWidths=[50*mm, 25*mm, 25*mm, doc.width - 100*mm], repeatRows=1)
+        table.setStyle(_TABLE_STYLE + [("BACKGROUND", (0,0), (-1,0), colors.lightgrey)])
+        elements.append(table)
+    else:
+        elements.append(p("Nenhum componente cadastrado."))
+    elements.append(Spacer(1, 10))
+
+    titulo = "Histórico"
+    if dossie["total_historico"] > len(dossie["historico"]):
+        titulo += f" (últimos {len(dossie['historico'])} de {dossie['total_historico']})"
+    elements.append(Paragraph(titulo, styles["Heading3"]))
+    foto_w, foto_h = 40*mm, 30*mm
+    hist = [[p(c, bold=True) for c in ("Data", "Hora", "Responsável", "Descrição", "Foto")]]
+    for h in dossie["historico"]:
+        foto = _thumbnail(fotos[h["id"]], foto_w, foto_h) if h["id"] in fotos else ""
+        hist.append([p(h["data"]), p((h["hora"] or "")[:5]), p(h["tecnico"]), p(h["descricao"]), foto])
+    if len(hist) > 1:
+        table = Table(hist, colWidths=[20*mm, 14*mm, 30*mm, doc.width - 64*mm - foto_w - 6, foto_w + 6], repeatRows=1)
+        table.setStyle(_TABLE_STYLE + [("BACKGROUND", (0,0), (-1,0), colors.lightgrey)])
+        elements.append(table)
+    else:
+        elements.append(p("Nenhum registro no histórico."))
+
+    doc.build(elements)
+    return tmp.name
+
+def _nome_arquivo(linha, nome, id_):
+    # O id garante nomes únicos no ZIP: linha e nome podem se repetir (ou faltar)
+    base = re.sub(r"[^\w.-]+", "_", nome or "", flags=re.UNICODE).strip("_") or "maquina"
+    return f"{linha or 0:04d}_{base}_{id_}.pdf"
+
+def gerar_zip_setor(setor, processos=None):
+    """Gera os dossiês de todas as máquinas do `setor` em paralelo e os reúne em um ZIP."""
+    rows = run_query("SELECT id, linha, nome FROM maquinas WHERE setor = %s ORDER BY linha", (setor,), fetch=True) or []
+    if not rows:
+        return None
+    ids = [r["id"] for r in rows]
+    # 'spawn' evita herdar por fork as threads e conexões do processo do servidor
+    with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pdfs = list(executor.map(gerar_pdf_maquina, ids))
+
+    tmp = NamedTemporaryFile(delete=False, suffix=".zip")
+    with zipfile.ZipFile(tmp.name, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for r, pdf_path in zip(rows, pdfs):
+            if pdf_path is None:
+                continue
+            zf.write(pdf_path, arcname=_nome_arquivo(r["linha"], r["nome"], r["id"]))
+            os.remove(pdf_path)
+    return tmp.name
@@ -0,0 +1,84 @@
+"""Orçamento de boot dos workers (ver core.db.preparar_schema e os imports tardios de core.reports).
+
+Rode a partir da raiz do projeto: python -m pytest tests
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ORCAMENTO_IMPORT = 2.0  # segundos para importar webapp.main num processo limpo
+
+pytest.importorskip("fastapi")
+pytest.importorskip("jinja2")
+pytest.importorskip("psycopg2")
+
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+
+def test_import_do_app_sem_reportlab_e_dentro_do_orcamento():
+    codigo = (
+        "import json, sys, time\n"
+        "t = time.perf_counter()\n"
+        "import webapp.main\n"
+        "print(json.dumps({'segundos': time.perf_counter() - t,"
+        " 'reportlab': any(m == 'reportlab' or m.startswith('reportlab.') for m in sys.modules)}))\n"
+    )
+    r = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, check=True)
+    resultado = json.loads(r.stdout.strip().splitlines()[-1])
+
+    assert not resultado["reportlab"], "webapp.main não deve importar o ReportLab no boot"
+    assert resultado["segundos"] < ORCAMENTO_IMPORT
+
+
+@pytest.fixture
+def app_main(monkeypatch):
+    # Os caminhos de templates/static em webapp.main são relativos à raiz
+    monkeypatch.chdir(RAIZ)
+    import webapp.main
+    return webapp.main
+
+
+def _registrar_consultas(monkeypatch, db, versao):
+    consultas = []
+
+    def run_query(query, params=None, fetch=False):
+        consultas.append(" ".join(query.split()))
+        return [{"versao": versao}]
+
+    monkeypatch.setattr(db, "run_query", run_query)
+    return consultas
+
+
+def test_startup_com_schema_atual_faz_so_uma_consulta(app_main, monkeypatch):
+    import core.db as db
+
+    consultas = _registrar_consultas(monkeypatch, db, db.SCHEMA_VERSAO)
+
+    def init_db():
+        raise AssertionError("init_db() não deve rodar com o schema atualizado")
+
+    monkeypatch.setattr(db, "init_db", init_db)
+    monkeypatch.setattr(app_main, "iniciar_escuta", lambda: None)
+
+    app_main.startup()
+
+    assert consultas == ["SELECT versao FROM schema_versao"]
+
+
+def test_startup_com_schema_antigo_roda_init_db(app_main, monkeypatch):
+    import core.db as db
+
+    _registrar_consultas(monkeypatch, db, db.SCHEMA_VERSAO - 1)
+    chamadas = []
+    monkeypatch.setattr(db, "init_db", lambda: chamadas.append("init_db"))
+    monkeypatch.setattr(app_main, "iniciar_escuta", lambda: None)
+
+    app_main.startup()
+
+    assert chamadas == ["init_db"]
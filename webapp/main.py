@@ -5,12 +5,13 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi import HTTPException
 from fastapi.responses import Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.gzip import GZipMiddleware
 
-from core.db import init_db, run_query
-from core.maquinas import listar_maquinas, adicionar_maquina, remover_maquina, atualizar_maquina
-from core.historico_maquinas import listar_historico, adicionar_historico, obter_foto_historico, remover_historico, atualizar_historico
+from core.db import preparar_schema, run_query
+from core.maquinas import listar_maquinas, adicionar_maquina, remover_maquina, atualizar_maquina, obter_dossie
+from core.historico_maquinas import listar_historico, obter_historico, adicionar_historico, obter_foto_historico, remover_historico, atualizar_historico
 from core.relatorios import adicionar_relatorio, atualizar_relatorio, remover_relatorio, listar_relatorios
-from core.reports import gerar_pdf_maquinas, gerar_pdf_historico, gerar_pdf_componentes, gerar_pdf_relatorios
 
 from core.componentes import (
     listar_componentes_por_maquina,
@@ -20,15 +21,65 @@ from core.componentes import (
     get_componente,
     listar_componentes_expirando,
 )
+from core.imagens import detectar_tipo_midia, recomprimir
+from core.cache import iniciar_escuta, parar_escuta
+from core.rede import agendar_varredura, listar_status_maquinas
+from core.alteracoes import listar_alteracoes, versao_dados
+from core.dashboard import resumo_por_setor, manutencoes_por_mes, componentes_expirando_por_mes, maquinas_sem_manutencao
+import asyncio
+import functools
+import hashlib
 import json
+import os
 from markupsafe import Markup
-from flask import request, render_template
-from core.db import run_query
+
+
+class _GZipTexto(GZipMiddleware):
+    """Comprime HTML/JSON/CSS; anexos, PDFs e ZIPs já são comprimidos e passam direto."""
+    _SEM_COMPRESSAO = ("/historico/foto/", "/relatorios/arquivo/", "/report/")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self._SEM_COMPRESSAO):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+class _StaticImutavel(StaticFiles):
+    """Arquivos pedidos com ?v=<hash> (ver static_url) nunca mudam nesse endereço:
+    o navegador pode guardá-los por um ano sem revalidar."""
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code == 200 and b"v=" in scope.get("query_string", b""):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+def _hash_arquivos(*diretorios):
+    h = hashlib.sha1()
+    for diretorio in diretorios:
+        for raiz, _, arquivos in sorted(os.walk(diretorio)):
+            for nome in sorted(arquivos):
+                with open(os.path.join(raiz, nome), "rb") as f:
+                    h.update(nome.encode())
+                    h.update(f.read())
+    return h.hexdigest()[:12]
+
+
+@functools.lru_cache(maxsize=None)
+def static_url(path: str) -> str:
+    """URL de um arquivo em webapp/static com a impressão digital do conteúdo."""
+    with open(os.path.join("webapp/static", path), "rb") as f:
+        return f"/static/{path}?v={hashlib.sha1(f.read()).hexdigest()[:12]}"
 
 
 app = FastAPI()
-app.mount("/static", StaticFiles(directory="webapp/static"), name="static")
+app.add_middleware(_GZipTexto, minimum_size=1000)
+app.mount("/static", _StaticImutavel(directory="webapp/static"), name="static")
 templates = Jinja2Templates(directory="webapp/templates")
+templates.env.globals["static_url"] = static_url
+# Muda a cada deploy que altere templates ou estáticos, invalidando os ETags antigos
+_VERSAO_APP = _hash_arquivos("webapp/templates", "webapp/static")
 # Adiciona filtro 'tojson' ao ambiente Jinja, pois FastAPI/Starlette não o fornece por padrão
 def _tojson_filter(value):
     def _default(o):
@@ -45,13 +96,57 @@ templates.env.filters["tojson"] = _tojson_filter
 
 @app.on_event("startup")
 def startup():
-    init_db()
+    # Só confere a versão do schema; o DDL completo roda uma vez via `python -m core.db`
+    preparar_schema()
+    iniciar_escuta()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    parar_escuta()
+
+
+@app.on_event("startup")
+async def iniciar_varredura_rede():
+    # Varredura periódica em segundo plano; as páginas só leem o cache em maquinas_status
+    app.state.varredura_rede = asyncio.create_task(agendar_varredura())
+
+
+@app.on_event("shutdown")
+async def parar_varredura_rede():
+    tarefa = getattr(app.state, "varredura_rede", None)
+    if tarefa is not None:
+        tarefa.cancel()
+
+
+def _resposta_condicional(request: Request, tabelas, rede: bool = False):
+    """Calcula o ETag da página a partir da versão dos dados e dos parâmetros da URL.
+
+    Retorna (etag, versao, resposta_304); resposta_304 é None quando o cliente
+    não tem a versão atual e a página precisa ser gerada. `versao` deve ser
+    repassada às leituras em cache (core/cache.py) que montam a página, para que
+    o corpo corresponda exatamente ao ETag.
+    """
+    versao = versao_dados(tabelas, rede=rede)
+    chave = (_VERSAO_APP, request.url.path, sorted(request.query_params.multi_items()), versao)
+    etag = 'W/"' + hashlib.sha1(repr(chave).encode()).hexdigest()[:20] + '"'
+    enviados = request.headers.get("if-none-match", "")
+    if etag.removeprefix("W/") in {t.strip().removeprefix("W/") for t in enviados.split(",")}:
+        return etag, versao, Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return etag, versao, None
+
 
+def _com_etag(response, etag):
+    response.headers["ETag"] = etag
+    # no-cache: o navegador pode guardar, mas revalida (If-None-Match) a cada visita
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
-def _get_alertas_componentes():
+
+def _get_alertas_componentes(versao=None):
     """Busca componentes que expiram em até 10 dias para exibir alertas no topo das páginas."""
     try:
-        return listar_componentes_expirando(10)
+        return listar_componentes_expirando(10, versao=versao)
     except Exception:
         return []
 
@@ -127,6 +222,7 @@ def delete_maquina(id_: int):
 
 @app.get("/report/maquinas")
 def report_maquinas():
+    from core.reports import gerar_pdf_maquinas  # importado sob demanda: ReportLab é pesado
     pdf_path = gerar_pdf_maquinas()
     return FileResponse(pdf_path, filename="maquinas.pdf")
 
@@ -210,9 +306,35 @@ def edit_maquina(id_: int,
 
     return RedirectResponse("/", status_code=303)
 
+@app.get("/maquinas/{id_:int}", response_class=HTMLResponse)
+def maquina_page(request: Request, id_: int):
+    dossie = obter_dossie(id_)
+    if dossie is None:
+        return RedirectResponse("/", status_code=303)
+    return templates.TemplateResponse("maquina.html", {"request": request, "maquina": dossie, "alertas_componentes": _get_alertas_componentes()})
+
+@app.get("/report/maquina/{id_}")
+def report_maquina(id_: int):
+    from core.reports import gerar_pdf_maquina
+    pdf_path = gerar_pdf_maquina(id_)
+    if pdf_path is None:
+        raise HTTPException(status_code=404, detail="Máquina não encontrada")
+    return FileResponse(pdf_path, filename=f"maquina_{id_}.pdf")
+
+@app.get("/report/setor")
+def report_setor(setor: str):
+    from core.reports import gerar_zip_setor
+    zip_path = gerar_zip_setor(setor)
+    if zip_path is None:
+        raise HTTPException(status_code=404, detail="Nenhuma máquina no setor")
+    return FileResponse(zip_path, filename=f"dossies_{setor}.zip", media_type="application/zip")
+
 @app.get("/", response_class=HTMLResponse)
 def index(request: Request, ordenar_por: str | None = None, direcao: str | None = None):
-    maquinas = listar_maquinas()
+    etag, versao, nao_modificado = _resposta_condicional(request, ("maquinas", "componentes"), rede=True)
+    if nao_modificado:
+        return nao_modificado
+    maquinas = listar_maquinas(versao=versao)
 
     if(ordenar_por):
         try:
@@ -233,45 +355,23 @@ def index(request: Request, ordenar_por: str | None = None, direcao: str | None
         except Exception:
             pass
 
-    return templates.TemplateResponse("index.html", {"request": request, "maquinas": maquinas, "ordenar_por": ordenar_por, "direcao": direcao, "alertas_componentes": _get_alertas_componentes()})
-
-@app.get("/")
-def index():
-    ordenar_por = request.args.get("ordenar_por", "linha")
-    direcao = request.args.get("direcao", "asc")
-    q = request.args.get("q", "").strip()
-
-    allowed = {"linha","nome","usuario","setor","andar","ip","mac","ponto","comentario"}
-    if ordenar_por not in allowed:
-        ordenar_por = "linha"
-    if direcao not in {"asc","desc"}:
-        direcao = "asc"
-
-    sql = """
-      SELECT id, linha, nome, usuario, setor, andar, ip, mac, ponto, comentario
-      FROM maquinas
-    """
-    params = []
-    if q:
-        like = f"%{q}%"
-        sql += """ 
-          WHERE (nome LIKE ? OR usuario LIKE ? OR setor LIKE ?
-                 OR ip LIKE ? OR mac LIKE ? OR ponto LIKE ? OR comentario LIKE ?)
-          COLLATE NOCASE
-        """
-        params = [like]*7
-
-    sql += f" ORDER BY {ordenar_por} {direcao}"
-    maquinas = run_query(sql, params, fetch=True)
-    return render_template("index.html", maquinas=maquinas, ordenar_por=ordenar_por, direcao=direcao, q=q, alertas_componentes=listar_componentes_expirando(10))
+    try:
+        status_rede = listar_status_maquinas()
+    except Exception:
+        status_rede = {}
 
+    return _com_etag(templates.TemplateResponse("index.html", {"request": request, "maquinas": maquinas, "status_rede": status_rede, "ordenar_por": ordenar_por, "direcao": direcao, "alertas_componentes": _get_alertas_componentes(versao)}), etag)
 
 # -------------------- HISTÓRICO --------------------
 @app.get("/historico", response_class=HTMLResponse)
-def historico_page(request: Request, maquina: int | None = None):
-    historico = listar_historico(maquina)
-    maquinas = listar_maquinas()
-    return templates.TemplateResponse("historico.html", {"request": request, "historico": historico, "maquinas": maquinas, "maquina_filter": maquina})
+def historico_page(request: Request, maquina: int | None = None, de: str | None = None, ate: str | None = None):
+    etag, versao, nao_modificado = _resposta_condicional(request, ("historico", "maquinas"))
+    if nao_modificado:
+        return nao_modificado
+    de, ate = _none_if_blank(de), _none_if_blank(ate)
+    historico = listar_historico(maquina, data_inicio=de, data_fim=ate)
+    maquinas = listar_maquinas(versao=versao)
+    return _com_etag(templates.TemplateResponse("historico.html", {"request": request, "historico": historico, "maquinas": maquinas, "maquina_filter": maquina, "de": de, "ate": ate}), etag)
 
 @app.post("/historico/add")
 async def add_historico(
@@ -284,7 +384,7 @@ async def add_historico(
 ):
     foto_bytes = None
     if arquivo and arquivo.filename:
-        foto_bytes = await arquivo.read()
+        foto_bytes = await run_in_threadpool(recomprimir, await arquivo.read())
     adicionar_historico(id_maquina, data, hora, tecnico, descricao, foto_bytes)
     return RedirectResponse(f"/historico?maquina={id_maquina}", status_code=303)
 
@@ -294,15 +394,14 @@ def delete_historico(id_: int):
     return RedirectResponse("/historico", status_code=303)
 
 @app.get("/report/historico")
-def report_historico():
-    pdf_path = gerar_pdf_historico()
+def report_historico(maquina: int | None = None, de: str | None = None, ate: str | None = None):
+    from core.reports import gerar_pdf_historico
+    pdf_path = gerar_pdf_historico(maquina, data_inicio=_none_if_blank(de), data_fim=_none_if_blank(ate))
     return FileResponse(pdf_path, filename="historico.pdf")
 
 @app.get("/historico/edit/{id_}", response_class=HTMLResponse)
 def edit_historico_page(request: Request, id_: int):
-    historico = listar_historico()
-    # RealDictRow é um mapeamento (dict-like). Use acesso por chave para evitar AttributeError.
-    item = next((h for h in historico if str(h['id']) == str(id_)), None)
+    item = obter_historico(id_)
     if item is None:
         return RedirectResponse("/", status_code=303)
     # usar o template existente e passar a variável esperada pelo template
@@ -318,64 +417,74 @@ async def edit_historico(id_: int,
                    arquivo: UploadFile | None = File(None)):
     foto_bytes = None
     if arquivo and arquivo.filename:
-        foto_bytes = await arquivo.read()
+        foto_bytes = await run_in_threadpool(recomprimir, await arquivo.read())
     atualizar_historico(id_, data=data, hora=hora, tecnico=tecnico, descricao=descricao, foto=foto_bytes)
     return RedirectResponse(f"/historico?maquina={id_maquina}", status_code=303)
 
-def _detect_media_type(data: bytes) -> str:
-    if data.startswith(b"%PDF"):
-        return "application/pdf"
-    if data.startswith(b"\x89PNG\r\n\x1a\n"):
-        return "image/png"
-    if data.startswith(b"\xff\xd8\xff"):
-        return "image/jpeg"
-    if data.startswith(b"GIF87a") or data.startswith(b"GIF89a"):
-        return "image/gif"
-    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
-        return "image/webp"
-    if data.startswith(b"BM"):
-        return "image/bmp"
-    return "application/octet-stream"
-
 @app.get("/historico/foto/{historico_id}")
-def historico_file(historico_id: int):
-    foto_bytes = obter_foto_historico(historico_id)
+def historico_file(historico_id: int, data: str | None = None):
+    # `data` é só uma dica para consultar apenas a partição do registro
+    foto_bytes = obter_foto_historico(historico_id, data=_none_if_blank(data))
     if foto_bytes is None:
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
 
     # Detecta tipo
     foto_bytes = bytes(foto_bytes)  # garante bytes (pode ser memoryview)
-    media_type = _detect_media_type(foto_bytes)
+    media_type = detectar_tipo_midia(foto_bytes)
 
     return Response(foto_bytes, media_type=media_type)
 
 # -------------------- COMPONENTES --------------------
-@app.get("/componentes/maquina/{id_}", response_class=HTMLResponse)
-def componentes_maquina_page(request: Request, id_: int):
-    componentes = listar_componentes_por_maquina(id_)
-    maquinas = listar_maquinas()
-    return templates.TemplateResponse("componentes_maquina.html", {"request": request, "componentes": componentes, "maquina_id": id_, "maquinas": maquinas})
+@app.get("/componentes/maquina/{id_}")
+def componentes_maquina_page(id_: int):
+    # Os componentes são exibidos na página de detalhes da máquina
+    return RedirectResponse(f"/maquinas/{id_}", status_code=303)
 
 @app.post("/componentes/add")
 def componentes_add(id_maquina: int = Form(...), nome: str = Form(...), data_aquisicao: Optional[str] = Form(None), data_expiracao: Optional[str] = Form(None), observacao: Optional[str] = Form(None)):
     adicionar_componente(id_maquina, nome, data_aquisicao, data_expiracao, observacao)
-    return RedirectResponse(f"/componentes/maquina/{id_maquina}", status_code=303)
+    return RedirectResponse(f"/maquinas/{id_maquina}", status_code=303)
 
 @app.get("/componentes/edit/{id_}")
 def componentes_edit(id_: int, id_maquina: int = Form(...), nome: str = Form(...), data_aquisicao: Optional[str] = Form(None), data_expiracao: Optional[str] = Form(None), observacao: Optional[str] = Form(None)):
     atualizar_componente(id_, nome, data_aquisicao, data_expiracao, observacao)
-    return RedirectResponse(f"/componentes/maquina/{id_maquina}", status_code=303)
+    return RedirectResponse(f"/maquinas/{id_maquina}", status_code=303)
 
 @app.get("/componentes/delete/{id_}/{id_maquina}")
 def componentes_delete(id_: int, id_maquina: int):
     remover_componente(id_)
-    return RedirectResponse(f"/componentes/maquina/{id_maquina}", status_code=303)
+    return RedirectResponse(f"/maquinas/{id_maquina}", status_code=303)
 
 @app.get("/report/componentes")
 def report_componentes():
+    from core.reports import gerar_pdf_componentes
     pdf_path = gerar_pdf_componentes()
     return FileResponse(pdf_path, filename="componentes.pdf")
 
+# -------------------- PAINEL --------------------
+@app.get("/dashboard", response_class=HTMLResponse)
+def dashboard(request: Request):
+    return templates.TemplateResponse(
+        "dashboard.html",
+        {
+            "request": request,
+            "por_setor": resumo_por_setor(),
+            "manutencoes": manutencoes_por_mes(12),
+            "expiracoes": componentes_expirando_por_mes(12),
+            "sem_manutencao": maquinas_sem_manutencao(12),
+            "alertas_componentes": _get_alertas_componentes(),
+        },
+    )
+
+# -------------------- SINCRONIZAÇÃO --------------------
+@app.get("/changes")
+def changes(since: str = "0", limite: int = 500):
+    """Alterações após o cursor `since`, em ordem; use `next` como cursor da próxima chamada."""
+    try:
+        return listar_alteracoes(since, limite)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
 # -------------------- RELATORIOS --------------------
 @app.get("/relatorios/add", response_class=HTMLResponse)
 def add_relatorio_page(request: Request):
@@ -393,6 +502,7 @@ async def add_relatorio(
     imagem: UploadFile | None = File(None),
 ):
     imagem_bytes = await imagem.read() if (imagem and imagem.filename) else None
+    imagem_bytes = await run_in_threadpool(recomprimir, imagem_bytes)
 
     data = _none_if_blank(data)
     hora = _none_if_blank(hora)
@@ -411,12 +521,16 @@ def delete_relatorio(id_: int):
 
 @app.get("/report/relatorios")
 def report_relatorios():
+    from core.reports import gerar_pdf_relatorios
     pdf_path = gerar_pdf_relatorios()
     return FileResponse(pdf_path, filename="relatorios.pdf")
 
 # Lista de relatórios com ordenação (usa os links do template)
 @app.get("/relatorios", response_class=HTMLResponse)
 def relatorios(request: Request, ordenar_por: str | None = None, direcao: str | None = None):
+    etag, versao, nao_modificado = _resposta_condicional(request, ("relatorios", "componentes", "maquinas"))
+    if nao_modificado:
+        return nao_modificado
     items = listar_relatorios()
     if ordenar_por:
         try:
@@ -426,10 +540,10 @@ def relatorios(request: Request, ordenar_por: str | None = None, direcao: str |
             items = sorted(items, key=_key, reverse=(direcao == "desc"))
         except Exception:
             pass
-    return templates.TemplateResponse(
+    return _com_etag(templates.TemplateResponse(
         "relatorios.html",
-        {"request": request, "relatorios": items, "ordenar_por": ordenar_por, "direcao": direcao, "alertas_componentes": _get_alertas_componentes()},
-    )
+        {"request": request, "relatorios": items, "ordenar_por": ordenar_por, "direcao": direcao, "alertas_componentes": _get_alertas_componentes(versao)},
+    ), etag)
 
 @app.get("/relatorios/edit/{id_}", response_class=HTMLResponse)
 def edit_relatorio_page(request: Request, id_: int):
@@ -450,6 +564,7 @@ async def edit_relatorio(id_: int,
                     comentario: Optional[str] = Form(None),
                     imagem: UploadFile | None = File(None)):
     imagem_bytes = await imagem.read() if (imagem and imagem.filename) else None
+    imagem_bytes = await run_in_threadpool(recomprimir, imagem_bytes)
 
     data = _none_if_blank(data)
     hora = _none_if_blank(hora)
@@ -485,5 +600,5 @@ def relatorio_arquivo(id_: int):
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
 
     data = bytes(blob) if not isinstance(blob, (bytes, bytearray)) else blob
-    media_type = _detect_media_type(data)
+    media_type = detectar_tipo_midia(data)
     return Response(data, media_type=media_type, headers={"Content-Disposition": f"inline; filename=relatorio_{id_}"})
\ No newline at end of file